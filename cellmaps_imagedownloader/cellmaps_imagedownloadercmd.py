@@ -12,10 +12,13 @@ from cellmaps_utils import constants
 import cellmaps_imagedownloader
 from cellmaps_imagedownloader.exceptions import CellMapsImageDownloaderError
 from cellmaps_imagedownloader.runner import MultiProcessImageDownloader
+from cellmaps_imagedownloader.runner import AsyncImageDownloader
+from cellmaps_imagedownloader.runner import IoUringImageDownloader
 from cellmaps_imagedownloader.runner import FakeImageDownloader
 from cellmaps_imagedownloader.runner import CellmapsImageDownloader
 from cellmaps_imagedownloader.runner import CM4AICopyDownloader
 from cellmaps_imagedownloader.gene import ImageGeneNodeAttributeGenerator
+from cellmaps_imagedownloader.gene import GeneQuery
 from cellmaps_imagedownloader.gene import CM4AITableConverter
 from cellmaps_imagedownloader.proteinatlas import ProteinAtlasReader, ProteinAtlasProcessor
 from cellmaps_imagedownloader.proteinatlas import ProteinAtlasImageUrlReader
@@ -85,7 +88,14 @@ def _parse_arguments(desc, args):
                         default=MultiProcessImageDownloader.POOL_SIZE,
                         help='If using multiprocessing image downloader, '
                              'this sets number of current downloads to run. '
+                             'If set to ' + str(AsyncImageDownloader.MIN_POOLSIZE) +
+                             ' or more and aiohttp is installed, an asyncio '
+                             'based downloader is used. '
                              'Note: Going above the default overloads the server')
+    parser.add_argument('--use_iouring', action='store_true',
+                        help='If set, images are written to disk via io_uring. '
+                             'Requires the optional liburing package and '
+                             'Linux 5.6+. Experimental')
     parser.add_argument('--imgsuffix', default=CellmapsImageDownloader.IMG_SUFFIX,
                         help='Suffix for images to download')
     parser.add_argument('--skip_existing', action='store_true',
@@ -93,6 +103,10 @@ def _parse_arguments(desc, args):
                              'has size greater then 0 bytes')
     parser.add_argument('--skip_failed', action='store_true',
                         help='If set, ignores images that failed to download after retries')
+    parser.add_argument('--genequery_cachedir', default=None,
+                        help='If set, results of gene symbol queries to mygene are '
+                             'cached in this directory and reused by later runs '
+                             'querying the same genes')
     parser.add_argument('--logconf', default=None,
                         help='Path to python logging configuration file in '
                              'this format: https://docs.python.org/3/library/'
@@ -242,12 +256,19 @@ Additional optional fields for registering datasets include
             if theargs.fake_images is True:
                 warnings.warn('FAKE IMAGES ARE BEING DOWNLOADED!!!!!')
                 dloader = FakeImageDownloader()
+            elif theargs.use_iouring is True:
+                dloader = IoUringImageDownloader(poolsize=theargs.poolsize,
+                                                 skip_existing=theargs.skip_existing)
+            elif theargs.poolsize >= AsyncImageDownloader.MIN_POOLSIZE and AsyncImageDownloader.is_available():
+                dloader = AsyncImageDownloader(poolsize=theargs.poolsize,
+                                               skip_existing=theargs.skip_existing)
             else:
                 dloader = MultiProcessImageDownloader(poolsize=theargs.poolsize,
                                                       skip_existing=theargs.skip_existing)
 
         imagegen = ImageGeneNodeAttributeGenerator(unique_list=unique_list,
-                                                   samples_list=samples_list)
+                                                   samples_list=samples_list,
+                                                   genequery=GeneQuery(cache_dir=theargs.genequery_cachedir))
 
         if theargs.cm4ai_table is not None:
             imageurlgen = CM4AIImageCopyTupleGenerator(samples_list=imagegen.get_samples_list())
@@ -270,7 +291,7 @@ Additional optional fields for registering datasets include
                                        skip_failed=theargs.skip_failed,
                                        existing_outdir=created_outdir).run()
     except Exception as e:
-        logger.exception('Caught exception: ' + str(e))
+        logger.exception('Caught exception: %s', e)
         return 2
     finally:
         logging.shutdown()
@@ -1,6 +1,12 @@
 import os
 import re
+import sys
 import csv
+import json
+import hashlib
+import tempfile
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 import mygene
 import logging
 import pandas as pd
@@ -8,19 +14,151 @@ from tqdm import tqdm
 
 from cellmaps_imagedownloader.exceptions import CellMapsImageDownloaderError
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+_ANTIBODY_PREFIX_RE = re.compile(r'^(?:HPA0*|CAB0*)')
+
+_SEMICOLON_SPLIT_RE = re.compile(r'\W*;\W*')
+
+_COMMA_SPLIT_RE = re.compile(r'\W*,\W*')
+
+
+def _json_loads(data):
+    """
+    Parses JSON in **data** using
+    `orjson <https://pypi.org/project/orjson>`__ if installed
+    otherwise :py:mod:`json`
+
+    :param data: JSON document
+    :type data: bytes
+    :return: parsed document
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj):
+    """
+    Serializes **obj** as JSON using
+    `orjson <https://pypi.org/project/orjson>`__ if installed
+    otherwise :py:mod:`json`
+
+    :param obj: object to serialize
+    :return: JSON document
+    :rtype: bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+def _iter_csv_columns(csvfile, columns, optional_columns=(),
+                      intern_columns=()):
+    """
+    Generator that reads **columns** from CSV file with a header line
+    yielding a dict per row. Column indices are looked up once from the
+    header so each row is converted with a single :py:func:`zip` instead of
+    the per row header mapping done by :py:class:`csv.DictReader`.
+    Like :py:class:`csv.DictReader`, blank lines are skipped, values
+    past the header are ignored and missing values are set to ``None``
+
+    :param csvfile: path to CSV file
+    :type csvfile: str
+    :param columns: columns to put in each dict
+    :type columns: list
+    :param optional_columns: columns to also put in each
+                             dict if in header
+    :type optional_columns: list
+    :param intern_columns: columns whose values repeat across rows
+                           and are passed to :py:func:`sys.intern`
+                           so rows share one copy of each value
+    :type intern_columns: list
+    :raises KeyError: if any of **columns** is not in header
+    :return: next row
+    :rtype: dict
+    """
+    with open(csvfile, 'r') as f:
+        reader = csv.reader(f, delimiter=',')
+        header = next(reader, None)
+        if header is None:
+            return
+        header_index = {name: i for i, name in enumerate(header)}
+        keys = list(columns) + [c for c in optional_columns if c in header_index]
+        indices = [header_index[key] for key in keys]
+        intern_indices = [i for i in indices if header[i] in intern_columns]
+        intern = sys.intern
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < len(header):
+                row += [None] * (len(header) - len(row))
+            for i in intern_indices:
+                if row[i] is not None:
+                    row[i] = intern(row[i])
+            yield dict(zip(keys, [row[i] for i in indices]))
+
+
+def _read_csv_columns(csvfile, columns, optional_columns=(),
+                      intern_columns=()):
+    """
+    Reads **columns** from CSV file with a header line into a list
+    of dicts via :py:func:`_iter_csv_columns`
+
+    :param csvfile: path to CSV file
+    :type csvfile: str
+    :param columns: columns to put in each dict
+    :type columns: list
+    :param optional_columns: columns to also put in each
+                             dict if in header
+    :type optional_columns: list
+    :param intern_columns: columns whose values are interned
+    :type intern_columns: list
+    :raises KeyError: if any of **columns** is not in header
+    :return: one dict per row
+    :rtype: list
+    """
+    return list(_iter_csv_columns(csvfile, columns,
+                                  optional_columns=optional_columns,
+                                  intern_columns=intern_columns))
+
 
 class GeneQuery(object):
     """
     Gets information about genes from mygene
     """
 
-    def __init__(self, mygeneinfo=mygene.MyGeneInfo()):
+    QUERY_CHUNK_SIZE = 1000
+    """
+    Number of genes sent to mygene in each query
+    made by :py:meth:`get_symbols_for_genes`
+    """
+
+    MAX_QUERY_THREADS = 4
+    """
+    Maximum number of queries :py:meth:`get_symbols_for_genes`
+    runs against mygene at the same time
+    """
+
+    def __init__(self, mygeneinfo=mygene.MyGeneInfo(), cache_dir=None):
         """
         Constructor
+
+        :param mygeneinfo: Used to query mygene
+        :type mygeneinfo: :py:class:`mygene.MyGeneInfo`
+        :param cache_dir: Directory where results of
+                          :py:meth:`get_symbols_for_genes` are cached
+                          so repeated queries for the same genes do not
+                          hit the network. If ``None`` nothing is cached
+        :type cache_dir: str
         """
         self._mg = mygeneinfo
+        self._cache_dir = cache_dir
 
     def querymany(self, queries, species=None,
                   scopes=None,
@@ -68,12 +206,100 @@ class GeneQuery(object):
                        'symbol': 'GENESYMBOL' }
         :rtype: list
         """
-        res = self.querymany(genelist,
-                             species='human',
-                             scopes=scopes,
-                             fields=['ensembl.gene', 'symbol'])
+        cache_file = self._get_cache_file(genelist, scopes)
+        if cache_file is not None and os.path.isfile(cache_file):
+            logger.debug('Loading gene symbols from cache: %s', cache_file)
+            try:
+                with open(cache_file, 'rb') as f:
+                    return _json_loads(f.read())
+            except (OSError, ValueError) as e:
+                # truncated or corrupt cache file is replaced
+                # with result of a new query below
+                logger.warning('Unable to load gene symbols from cache %s, '
+                               'querying mygene instead: %s', cache_file, e)
+
+        res = self._query_symbols_in_chunks(genelist, scopes)
+        if cache_file is not None:
+            self._write_cache_file(cache_file, res)
+        return res
+
+    def _query_symbols_in_chunks(self, genelist, scopes):
+        """
+        Queries mygene for **genelist** in chunks of
+        :py:const:`QUERY_CHUNK_SIZE` genes, running up to
+        :py:const:`MAX_QUERY_THREADS` queries at the same time since
+        mygene would otherwise send the chunks one after another.
+        Results are concatenated in the order of **genelist**
+
+        :param genelist: genes to query
+        :type genelist: list
+        :param scopes: field to query on
+        :type scopes: str
+        :return: result from mygene
+        :rtype: list
+        """
+        fields = ['ensembl.gene', 'symbol']
+        if genelist is None or len(genelist) <= GeneQuery.QUERY_CHUNK_SIZE:
+            return self.querymany(genelist, species='human',
+                                  scopes=scopes, fields=fields)
+        chunks = [genelist[i:i + GeneQuery.QUERY_CHUNK_SIZE]
+                  for i in range(0, len(genelist), GeneQuery.QUERY_CHUNK_SIZE)]
+        with ThreadPoolExecutor(max_workers=min(GeneQuery.MAX_QUERY_THREADS,
+                                                len(chunks))) as executor:
+            chunk_results = list(executor.map(lambda chunk: self.querymany(chunk,
+                                                                           species='human',
+                                                                           scopes=scopes,
+                                                                           fields=fields),
+                                              chunks))
+        res = []
+        for chunk_res in chunk_results:
+            res.extend(chunk_res)
         return res
 
+    def _get_cache_file(self, genelist, scopes):
+        """
+        Gets path to cache file for query of **genelist** on
+        **scopes** which is named by sha1 digest of the scope and
+        sorted genes so the order genes are passed in does not matter
+
+        :param genelist: genes to query
+        :type genelist: list
+        :param scopes: field to query on
+        :type scopes: str
+        :return: path to cache file or ``None`` if caching is disabled
+        :rtype: str
+        """
+        if self._cache_dir is None or genelist is None:
+            return None
+        key = scopes + '\n' + ','.join(sorted(str(g) for g in genelist))
+        return os.path.join(self._cache_dir,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _write_cache_file(self, cache_file, res):
+        """
+        Writes **res** to **cache_file** as JSON. The file is written
+        under a temporary name and then renamed so a concurrent reader
+        never sees a partial file. Failures are logged and ignored
+
+        :param cache_file: path to cache file
+        :type cache_file: str
+        :param res: result of query
+        :type res: list
+        """
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(_json_dumps(res))
+                os.replace(tmp_file, cache_file)
+            except BaseException:
+                os.unlink(tmp_file)
+                raise
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning('Unable to cache gene symbols in %s : %s',
+                           cache_file, e)
+
 
 class CM4AITableConverter(object):
     """
@@ -212,6 +438,20 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
     Column labels for unique file
     """
 
+    SAMPLES_INTERN_COLS = ['if_plate_id', 'locations', 'antibody',
+                           'ensembl_ids', 'gene_names', LINKPREFIX_HEADER]
+    """
+    Columns of samples file whose values repeat across rows
+    and are interned when read
+    """
+
+    UNIQUE_INTERN_COLS = ['ensembl_ids', 'gene_names', 'atlas_name',
+                          'locations', 'n_location']
+    """
+    Columns of unique file whose values repeat across rows
+    and are interned when read
+    """
+
     def __init__(self, samples_list=None,
                  unique_list=None,
                  genequery=GeneQuery()):
@@ -305,14 +545,12 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
             return
         unique_antibodies = self._get_set_of_antibodies_from_unique_list()
 
-        entries_to_remove = []
-        for entry in self._samples_list:
-            if entry['antibody'] not in unique_antibodies:
-                entries_to_remove.append(entry)
-                continue
-        logger.debug('Removing ' + str(len(entries_to_remove)) + ' entries')
-        for entry in entries_to_remove:
-            self._samples_list.remove(entry)
+        # list is rebuilt in place since list.remove() per entry
+        # rescans the list making the filter quadratic
+        kept = [entry for entry in self._samples_list
+                if entry['antibody'] in unique_antibodies]
+        logger.debug('Removing %d entries', len(self._samples_list) - len(kept))
+        self._samples_list[:] = kept
 
     def filter_samples_by_sample_urlmap(self, sample_url_map):
         """
@@ -329,15 +567,11 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
         if sample_url_map is None:
             logger.info('sample_url_map is None, no filtering performed')
             return
-        entries_to_remove = []
-        for entry in self._samples_list:
-            image_id = ImageGeneNodeAttributeGenerator.get_image_id_for_sample(entry)
-            if image_id not in sample_url_map:
-                entries_to_remove.append(entry)
-
-        logger.debug('Removing ' + str(len(entries_to_remove)) + ' entries')
-        for entry in entries_to_remove:
-            self._samples_list.remove(entry)
+        get_image_id = ImageGeneNodeAttributeGenerator.get_image_id_for_sample
+        kept = [entry for entry in self._samples_list
+                if get_image_id(entry) in sample_url_map]
+        logger.debug('Removing %d entries', len(self._samples_list) - len(kept))
+        self._samples_list[:] = kept
 
     def get_samples_list(self):
         """
@@ -395,10 +629,8 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
         for keyword in ['antibody', 'position', 'sample', 'if_plate_id']:
             if keyword not in sample:
                 raise CellMapsImageDownloaderError(keyword + ' not in sample')
-        return re.sub('^HPA0*|^CAB0*', '', str(sample['antibody'])) + '/' + \
-            str(sample['if_plate_id']) + \
-            '_' + str(sample['position']) + \
-            '_' + str(sample['sample']) + '_'
+        return (f"{_ANTIBODY_PREFIX_RE.sub('', str(sample['antibody']))}/"
+                f"{sample['if_plate_id']}_{sample['position']}_{sample['sample']}_")
 
     @staticmethod
     def get_samples_from_csvfile(csvfile=None):
@@ -413,18 +645,32 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
         if csvfile is None:
             raise CellMapsImageDownloaderError('csvfile is None')
 
-        samples = []
-        with open(csvfile, 'r') as f:
-            reader = csv.DictReader(f, delimiter=',')
-            for row in reader:
-                sample_entry = {}
-                for key in ImageGeneNodeAttributeGenerator.SAMPLES_HEADER_COLS:
-                    sample_entry[key] = row[key]
-                if ImageGeneNodeAttributeGenerator.LINKPREFIX_HEADER in row:
-                    sample_entry[ImageGeneNodeAttributeGenerator.LINKPREFIX_HEADER] = row[
-                        ImageGeneNodeAttributeGenerator.LINKPREFIX_HEADER]
-                samples.append(sample_entry)
-        return samples
+        return _read_csv_columns(csvfile,
+                                 ImageGeneNodeAttributeGenerator.SAMPLES_HEADER_COLS,
+                                 optional_columns=[ImageGeneNodeAttributeGenerator.LINKPREFIX_HEADER],
+                                 intern_columns=ImageGeneNodeAttributeGenerator.SAMPLES_INTERN_COLS)
+
+    @staticmethod
+    def iter_samples_from_csvfile(csvfile=None):
+        """
+        Generator that reads samples from a CSV file one at a time
+        so a large file does not have to be loaded into memory.
+        Can be passed as **samples** to
+        :py:meth:`get_dicts_of_gene_to_antibody_filename`
+
+        :param csvfile: Path to the CSV file to read samples from.
+        :type csvfile: str
+        :raises CellMapsImageDownloaderError: if **csvfile** is ``None``
+        :return: next sample
+        :rtype: dict
+        """
+        if csvfile is None:
+            raise CellMapsImageDownloaderError('csvfile is None')
+
+        return _iter_csv_columns(csvfile,
+                                 ImageGeneNodeAttributeGenerator.SAMPLES_HEADER_COLS,
+                                 optional_columns=[ImageGeneNodeAttributeGenerator.LINKPREFIX_HEADER],
+                                 intern_columns=ImageGeneNodeAttributeGenerator.SAMPLES_INTERN_COLS)
 
     def get_unique_list(self):
         """
@@ -444,15 +690,9 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
         if csvfile is None:
             raise CellMapsImageDownloaderError('csvfile is None')
 
-        u_list = []
-        with open(csvfile, 'r') as f:
-            reader = csv.DictReader(f, delimiter=',')
-            for row in reader:
-                unique_entry = {}
-                for key in ImageGeneNodeAttributeGenerator.UNIQUE_HEADER_COLS:
-                    unique_entry[key] = row[key]
-                u_list.append(unique_entry)
-        return u_list
+        return _read_csv_columns(csvfile,
+                                 ImageGeneNodeAttributeGenerator.UNIQUE_HEADER_COLS,
+                                 intern_columns=ImageGeneNodeAttributeGenerator.UNIQUE_INTERN_COLS)
 
     def write_unique_list_to_csvfile(self, csvfile=None):
         """
@@ -463,13 +703,12 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
         """
         if csvfile is None:
             raise CellMapsImageDownloaderError('csvfile is None')
+        cols = ImageGeneNodeAttributeGenerator.UNIQUE_HEADER_COLS
         with open(csvfile, 'w', newline='') as f:
-            writer = csv.DictWriter(f,
-                                    fieldnames=ImageGeneNodeAttributeGenerator.UNIQUE_HEADER_COLS,
-                                    delimiter=',')
-            writer.writeheader()
-            for unique_entry in self._unique_list:
-                writer.writerow(unique_entry)
+            writer = csv.writer(f, delimiter=',')
+            writer.writerow(cols)
+            writer.writerows([unique_entry.get(c, '') for c in cols]
+                             for unique_entry in self._unique_list)
 
     def write_samples_to_csvfile(self, csvfile=None):
         """
@@ -480,20 +719,14 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
         """
         if csvfile is None:
             raise CellMapsImageDownloaderError('csvfile is None')
+        # only header columns are written so extra keys
+        # such as linkprefix are left out
+        cols = ImageGeneNodeAttributeGenerator.SAMPLES_HEADER_COLS
         with open(csvfile, 'w', newline='') as f:
-            writer = csv.DictWriter(f,
-                                    fieldnames=ImageGeneNodeAttributeGenerator.SAMPLES_HEADER_COLS,
-                                    delimiter=',')
-            writer.writeheader()
-            for sample in self._samples_list:
-
-                # Todo clean this up because its such a hack
-                if 'linkprefix' in sample:
-                    row_copy = sample.copy()
-                    del row_copy['linkprefix']
-                else:
-                    row_copy = sample
-                writer.writerow(row_copy)
+            writer = csv.writer(f, delimiter=',')
+            writer.writerow(cols)
+            writer.writerows([sample.get(c, '') for c in cols]
+                             for sample in self._samples_list)
 
     def _get_unique_ids_from_samplelist(self, column='ensembl_ids'):
         """
@@ -516,17 +749,23 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
         :rtype: list
         """
         id_set = set()
+        # many samples share the same ids so each distinct
+        # value only needs to be split once
+        seen_geneids = set()
         for row in self._samples_list:
             geneid = row[column]
-
+            if geneid in seen_geneids:
+                continue
             if str(geneid) == 'nan':
-                logger.info('Skipping because row has nan: ' + str(row))
+                logger.info('Skipping because row has nan: %s', row)
                 continue
+            seen_geneids.add(geneid)
             if ';' in geneid:
-                split_str = re.split('\W*;\W*', geneid)
+                id_set.update(_SEMICOLON_SPLIT_RE.split(geneid))
+            elif ',' in geneid:
+                id_set.update(_COMMA_SPLIT_RE.split(geneid))
             else:
-                split_str = re.split('\W*,\W*', geneid)
-            id_set.update(split_str)
+                id_set.add(geneid)
 
         return list(id_set)
 
@@ -542,48 +781,63 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
             raise CellMapsImageDownloaderError('unique list is None')
 
         antibody_set = set()
+        add_antibody = antibody_set.add
         for a in self._unique_list:
-            if 'antibody' not in a:
+            if 'antibody' in a:
+                add_antibody(a['antibody'])
+            else:
                 logger.warning('Skipping because antibody not found '
-                               'in unique entry: ' + str(a))
-                continue
-            antibody_set.add(a['antibody'])
+                               'in unique entry: %s', a)
         return antibody_set
 
-    def get_dicts_of_gene_to_antibody_filename(self):
+    def get_dicts_of_gene_to_antibody_filename(self, samples=None):
         """
         Gets a tuple of dictionaries from the sample list passed in via
         the constructor.
 
+        :param samples: If set, samples to use instead of those passed
+                        in via the constructor. Only iterated over once
+                        so a generator such as one from
+                        :py:meth:`iter_samples_from_csvfile` can be used
+        :type samples: iterable
         :return: (:py:class:`dict` of ensembl_id => antibody,
                   :py:class:`dict` of antibody => filename,
                   :py:class:`dict` of antibody => comma delimited ambiguous ensembl_ids)
 
         :rtype: tuple
         """
-        if self._samples_list is None:
+        if samples is None:
+            samples = self._samples_list
+        if samples is None:
             raise CellMapsImageDownloaderError('samples list is None')
 
         g_antibody_dict = {}
         antibody_filename_dict = {}
         ambiguous_antibody_dict = {}
 
-        for sample in self._samples_list:
+        prev_antibody_and_ids = None
+        for sample in samples:
             antibody = sample['antibody']
 
             if str(sample['ensembl_ids']) == 'nan':
                 # skipping because these are most likely negative control entries
                 continue
 
+            antibody_filename_dict.setdefault(antibody, set()).add(f"{sample['if_plate_id']}_"
+                                                                   f"{sample['position']}_"
+                                                                   f"{sample['sample']}_")
+
+            # samples of an antibody are usually listed together and
+            # repeating the genes of the previous sample changes nothing
+            antibody_and_ids = (antibody, sample['ensembl_ids'])
+            if antibody_and_ids == prev_antibody_and_ids:
+                continue
+            prev_antibody_and_ids = antibody_and_ids
+
             ensembl_ids = sample['ensembl_ids'].split(',')
             if len(ensembl_ids) > 1:
                 ambiguous_antibody_dict[antibody] = ensembl_ids
 
-            if antibody not in antibody_filename_dict:
-                antibody_filename_dict[antibody] = set()
-            antibody_filename_dict[antibody].add(sample['if_plate_id'] + '_' +
-                                                 sample['position'] + '_' +
-                                                 sample['sample'] + '_')
             for g in ensembl_ids:
                 # if gene already has nonambgiuous antibody, use that one
                 if g in g_antibody_dict:
@@ -653,13 +907,12 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
             #  'ensembl': [{'gene': 'ENSG00000273706'},
             #              {'gene': 'ENSG00000274577'}],
             #  'symbol': 'LHX1'}
-            if symbol not in symbol_ensembl_dict:
-                symbol_ensembl_dict[symbol] = set()
-            if len(x['ensembl']) > 1:
-                for g in x['ensembl']:
-                    symbol_ensembl_dict[symbol].add(g['gene'])
+            ensembl = x['ensembl']
+            ensembl_set = symbol_ensembl_dict.setdefault(symbol, set())
+            if isinstance(ensembl, list):
+                ensembl_set.update([g['gene'] for g in ensembl])
             else:
-                symbol_ensembl_dict[symbol].add(x['ensembl']['gene'])
+                ensembl_set.add(ensembl['gene'])
 
         return query_symbol_dict, symbol_query_dict, symbol_ensembl_dict, errors
 
@@ -682,36 +935,42 @@ class ImageGeneNodeAttributeGenerator(GeneNodeAttributeGenerator):
         :rtype: dict
         """
         gene_node_attrs = {}
-        for symbol in symbol_query_dict:
-            for query in symbol_query_dict[symbol]:
+        # number of ambiguous genes of antibody picked for each symbol
+        num_ambiguous_dict = {}
+        # antibodies are shared by many queries so their
+        # filename and ambiguous symbols are only worked out once
+        antibody_info_dict = {}
+        for symbol, queries in symbol_query_dict.items():
+            # same for every query of symbol
+            ensemble_str = ','.join(sorted(symbol_ensembl_dict[symbol]))
+            for query in queries:
                 if query not in query_antibody_dict:
                     continue
 
                 antibody_str = query_antibody_dict[query]
 
-                filenames = list(antibody_filename_dict[antibody_str])
-                if len(filenames) < fold:
-                    filename_str = filenames[0]
-                else:
-                    filename_str = filenames[fold - 1]
-
-                ambiguous_symbols = []
-                if antibody_str in ambiguous_antibody_dict:
-                    ambiguous_queries = ambiguous_antibody_dict[antibody_str]
-                    for ambiguous_query in ambiguous_queries:
-                        if ambiguous_query in query_symbol_dict:
-                            ambiguous_symbols.append(query_symbol_dict[ambiguous_query])
-                        else:
-                            ambiguous_symbols.append(ambiguous_query)
-                ambiguous_str = ','.join(sorted(ambiguous_symbols))
-
-                ensemble_str = ','.join(sorted(symbol_ensembl_dict[symbol]))
+                if antibody_str not in antibody_info_dict:
+                    filenames = antibody_filename_dict[antibody_str]
+                    # same element list(filenames)[index] would give
+                    # without copying the whole set
+                    index = fold - 1 if len(filenames) >= fold else 0
+                    filename_str = next(islice(filenames, index, None))
+
+                    ambiguous_symbols = [query_symbol_dict.get(ambiguous_query, ambiguous_query)
+                                         for ambiguous_query in
+                                         ambiguous_antibody_dict.get(antibody_str, [])]
+                    antibody_info_dict[antibody_str] = (filename_str,
+                                                        ','.join(sorted(ambiguous_symbols)),
+                                                        len(ambiguous_symbols))
+                filename_str, ambiguous_str, num_ambiguous = antibody_info_dict[antibody_str]
 
                 if symbol in gene_node_attrs:
                     # if less ambiguous antibody already exists, go with first option; otherwise will replace
-                    if len(ambiguous_symbols) > len(gene_node_attrs[symbol]['ambiguous'].split(',')):
+                    if num_ambiguous > num_ambiguous_dict[symbol]:
                         continue
 
+                # an empty ambiguous string still counts as 1 when split
+                num_ambiguous_dict[symbol] = max(1, num_ambiguous)
                 gene_node_attrs[symbol] = {'name': symbol,
                                            'represents': ensemble_str,
                                            'ambiguous': ambiguous_str,
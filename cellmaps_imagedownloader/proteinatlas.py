@@ -1,9 +1,11 @@
 import os
 import re
+import stat
 import gzip
 import logging
 import shutil
 import time
+from itertools import islice
 import xml.etree.ElementTree as ET
 import pandas as pd
 
@@ -14,8 +16,69 @@ from tqdm import tqdm
 from cellmaps_utils import constants
 from cellmaps_imagedownloader.exceptions import CellMapsImageDownloaderError
 
+try:
+    from isal import igzip
+except ImportError:  # pragma: no cover
+    igzip = None
+
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+"""
+Size in bytes of chunks read when downloading proteinatlas file
+"""
+
+READ_PROGRESS_LINES = 1 << 16
+"""
+Number of lines read from proteinatlas file between progress bar updates
+"""
+
+_ANTIBODY_PREFIX_RE = re.compile(r'^(?:HPA0*|CAB0*)')
+
+
+def _gzip_open(filename, mode='rb'):
+    """
+    Opens gzip file **filename** using ``igzip`` from
+    `isal <https://pypi.org/project/isal>`__ if installed
+    otherwise :py:mod:`gzip`
+
+    :param filename: Path to gzip file or open binary file
+    :type filename: str or file
+    :param mode: Mode as accepted by :py:func:`gzip.open`
+    :type mode: str
+    :return: open file
+    """
+    if igzip is not None:
+        return igzip.open(filename, mode=mode)
+    return gzip.open(filename, mode=mode)
+
+
+def _iter_lines_with_progress(f, rawfile, desc, total):
+    """
+    Generator that yields lines of text file **f** updating
+    a progress bar, measured in bytes read from **rawfile**,
+    every :py:const:`READ_PROGRESS_LINES` lines instead of per line
+
+    :param f: Open text file to read lines from
+    :type f: file
+    :param rawfile: Open binary file underlying **f** whose
+                    :py:meth:`tell` is used for progress
+    :type rawfile: file
+    :param desc: Description for progress bar
+    :type desc: str
+    :param total: Size of **rawfile** in bytes
+    :type total: int
+    :return: next line of file
+    :rtype: str
+    """
+    with tqdm(desc=desc, unit='B', unit_scale=True, total=total) as t:
+        while True:
+            lines = list(islice(f, READ_PROGRESS_LINES))
+            yield from lines
+            t.update(rawfile.tell() - t.n)
+            if len(lines) < READ_PROGRESS_LINES:
+                return
+
 
 def download_proteinalas_file(outdir, proteinatlas, max_retries=3, retry_wait=10):
     # use python requests to download the file and then get its results
@@ -32,13 +95,12 @@ def download_proteinalas_file(outdir, proteinatlas, max_retries=3, retry_wait=10
                                 total=content_size,
                                 unit='B', unit_scale=True,
                                 unit_divisor=1024)
-                logger.debug('Downloading ' + str(proteinatlas) +
-                             ' of size ' + str(content_size) +
-                             'b to ' + local_file)
+                logger.debug('Downloading %s of size %db to %s',
+                             proteinatlas, content_size, local_file)
                 try:
                     r.raise_for_status()
                     with open(local_file, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192):
+                        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
                             f.write(chunk)
                             tqdm_bar.update(len(chunk))
                     download_successful = True
@@ -48,7 +110,7 @@ def download_proteinalas_file(outdir, proteinatlas, max_retries=3, retry_wait=10
             return local_file
 
         except RequestException as he:
-            logger.debug(str(he.response.text))
+            logger.debug('%s', he.response.text)
             retry_num += 1
             time.sleep(retry_wait)
 
@@ -91,7 +153,7 @@ class ProteinAtlasProcessor(object):
         """
         Decompress a .gz file.
         """
-        with gzip.open(gz_file, 'rb') as f_in:
+        with _gzip_open(gz_file, 'rb') as f_in:
             with open(output_file, 'wb') as f_out:
                 shutil.copyfileobj(f_in, f_out)
         return output_file
@@ -111,7 +173,8 @@ class ProteinAtlasProcessor(object):
         context = ET.iterparse(self._proteinatlas, events=('end',))
         for event, elem in context:
             if elem.tag == 'entry':
-                gene_name = elem.find('name').text if elem.find('name') is not None else None
+                name_elem = elem.find('name')
+                gene_name = name_elem.text if name_elem is not None else None
                 if self.protein_set and gene_name not in self.protein_set:
                     elem.clear()
                     continue
@@ -121,23 +184,25 @@ class ProteinAtlasProcessor(object):
                     elem.clear()
                     continue
 
-                antibody = antibody_elem.attrib['id'] if elem.find('antibody') is not None else None
+                antibody = antibody_elem.attrib['id']
 
                 image_data = antibody_elem.find('cellExpression')
                 if image_data is None or image_data.attrib['source'] != "HPA":
                     elem.clear()
                     continue
 
+                ensembl_id = elem.attrib['url'].split('/')[-1]
                 data_points = image_data.findall('.//data')
                 for dp in data_points:
                     cellline = dp.find('cellLine').text
                     if self._cell_line and cellline.upper() != self._cell_line:
                         continue
-                    locations = [location.text for location in dp.findall('.//location')]
-                    image_urls = [image.find('imageUrl').text for image in dp.findall('.//image') if
-                                  'blue' in image.find('imageUrl').text]
+                    image_urls = [url for url in (image.find('imageUrl').text
+                                                  for image in dp.iterfind('.//image'))
+                                  if 'blue' in url]
                     if len(image_urls) == 0:
                         continue
+                    locations = ', '.join([location.text for location in dp.iterfind('.//location')])
 
                     for im_url in image_urls:
                         filename = im_url.split("/")[-1].replace('blue_red_green.jpg', '')
@@ -149,9 +214,9 @@ class ProteinAtlasProcessor(object):
                             'position': position,
                             'sample': sample,
                             'status': 35,
-                            'locations': ', '.join(locations),
+                            'locations': locations,
                             'antibody': antibody,
-                            'ensembl_ids': elem.attrib['url'].split('/')[-1],
+                            'ensembl_ids': ensembl_id,
                             'gene_names': gene_name,
                             'atlas_name': cellline,
                             'image_urls': im_url
@@ -198,8 +263,7 @@ class ProteinAtlasReader(object):
         :return: next line of file
         :rtype: str
         """
-        for line in self._readline(self._proteinatlas):
-            yield line
+        yield from self._readline(self._proteinatlas)
 
     def _readline(self, proteinatlas, max_retries=3, retry_wait=10):
         """
@@ -215,23 +279,27 @@ class ProteinAtlasReader(object):
         :return: next line of file
         :rtype: str
         """
-        if os.path.isfile(proteinatlas):
+        try:
+            st = os.stat(proteinatlas)
+        except OSError:
+            st = None
+        if st is not None and stat.S_ISREG(st.st_mode):
             if proteinatlas.endswith('.gz'):
-                with gzip.open(proteinatlas, mode='rt') as f:
-                    for line in tqdm(f, desc='Processing proteinatlas.xml.gz', unit='bytes',
-                                     total=os.path.getsize(proteinatlas)):
-                        yield line
+                with open(proteinatlas, 'rb') as rawfile,\
+                        _gzip_open(rawfile, mode='rt') as f:
+                    yield from _iter_lines_with_progress(f, rawfile,
+                                                         'Processing proteinatlas.xml.gz',
+                                                         st.st_size)
                 return
             with open(proteinatlas, 'r') as f:
-                for line in tqdm(f, desc='Processing proteinatlas.xml', unit='bytes',
-                                 total=os.path.getsize(proteinatlas)):
-                    yield line
+                yield from _iter_lines_with_progress(f, f.buffer,
+                                                     'Processing proteinatlas.xml',
+                                                     st.st_size)
             return
 
         local_file = download_proteinalas_file(self._outdir, proteinatlas, max_retries, retry_wait)
 
-        for line in self._readline(local_file):
-            yield line
+        yield from self._readline(local_file)
 
 
 class ProteinAtlasImageUrlReader(object):
@@ -259,17 +327,26 @@ class ProteinAtlasImageUrlReader(object):
         :return: content between > and < characters
         :rtype: str
         """
-        m = re.search('^.*>(.*)<.*$', line)
-        return m.group(1)
+        end = line.rindex('<')
+        return line[line.rindex('>', 0, end) + 1:end]
 
     def _get_image_id(self, image_url):
         """
+        Gets image id from **image_url** which is the first three
+        ``_`` delimited parts of the last two path elements of the URL
 
-        :param image_url:
-        :return:
+        Example:
+
+        ``http://images.proteinatlas.org/39292/1495_A11_1_blue_red_green.jpg``
+        gives ``39292/1495_A11_1_``
+
+        :param image_url: URL of image
+        :type image_url: str
+        :return: image id
+        :rtype: str
         """
-        antibody_and_id = '/'.join(image_url.split('/')[-2:])
-        return '_'.join(antibody_and_id.split('_')[0:3]) + '_'
+        antibody_and_id = '/'.join(image_url.rsplit('/', 2)[-2:])
+        return '_'.join(antibody_and_id.split('_', 3)[:3]) + '_'
 
     def get_next_image_id_and_url(self):
         """
@@ -278,12 +355,10 @@ class ProteinAtlasImageUrlReader(object):
         :rtype: tuple
         """
         for line in self._reader.readline():
-            line = line.rstrip()
-            if '<imageUrl>' not in line:
-                continue
-            if 'blue' not in line:
+            # only the few matching lines are stripped
+            if '<imageUrl>' not in line or 'blue' not in line:
                 continue
-            image_url = self._get_url_from_line(line)
+            image_url = self._get_url_from_line(line.rstrip())
             yield self._get_image_id(image_url), image_url
 
 
@@ -362,28 +437,24 @@ class ImageDownloadTupleGenerator(object):
         if self._sample_urlmap is None:
             self._populate_sample_urlmap()
 
+        # (color, destination directory with trailing separator) pairs
+        color_prefixes = tuple((c, os.path.join(color_download_map[c], ''))
+                               for c in constants.COLORS)
         for sample in self._samples_list:
-            image_id = re.sub('^HPA0*|^CAB0*', '', sample['antibody']) + '/' + \
-                       sample['if_plate_id'] + \
-                       '_' + sample['position'] + \
-                       '_' + sample['sample'] + '_'
+            image_filename = f"{sample['if_plate_id']}_{sample['position']}_{sample['sample']}_"
+            image_id = _ANTIBODY_PREFIX_RE.sub('', sample['antibody']) + '/' + image_filename
             if image_id not in self._sample_urlmap:
                 logger.error(image_id + ' not in sample map which means '
                                         'no URL was found to acquire '
                                         'said image')
                 continue
 
-            image_filename = sample['if_plate_id'] + \
-                             '_' + sample['position'] + \
-                             '_' + sample['sample'] + '_'
-            for c in constants.COLORS:
-                sample_url = self._sample_urlmap[image_id]
-                (image_url_prefix,
-                 image_suffix) = self._get_image_prefix_suffix(sample_url)
-
+            # url prefix and suffix are the same for every color
+            (image_url_prefix,
+             image_suffix) = self._get_image_prefix_suffix(self._sample_urlmap[image_id])
+            for c, dir_prefix in color_prefixes:
                 yield (image_url_prefix + c + image_suffix,
-                       os.path.join(color_download_map[c],
-                                    image_filename + c + image_suffix))
+                       dir_prefix + image_filename + c + image_suffix)
 
 
 class LinkPrefixImageDownloadTupleGenerator(object):
@@ -406,12 +477,10 @@ class LinkPrefixImageDownloadTupleGenerator(object):
 
         :return:
         """
-        self._sample_urlmap = {}
-        for sample in self._samples_list:
-            image_id = re.sub('^HPA0*|^CAB0*', '', sample['antibody']) + '/' + \
-                       sample['filename']
-
-            self._sample_urlmap[image_id] = sample['linkprefix'] + 'blue_red_green.jpg'
+        self._sample_urlmap = {
+            f"{_ANTIBODY_PREFIX_RE.sub('', sample['antibody'])}/{sample['filename']}":
+                f"{sample['linkprefix']}blue_red_green.jpg"
+            for sample in self._samples_list}
 
         logger.debug(self._sample_urlmap)
 
@@ -449,26 +518,22 @@ class LinkPrefixImageDownloadTupleGenerator(object):
         if self._sample_urlmap is None:
             self._populate_sample_urlmap()
 
+        # (color, destination directory with trailing separator) pairs
+        color_prefixes = tuple((c, os.path.join(color_download_map[c], ''))
+                               for c in constants.COLORS)
         for sample in self._samples_list:
-            image_id = re.sub('^HPA0*|^CAB0*', '', sample['antibody']) + '/' + \
-                       sample['if_plate_id'] + \
-                       '_' + sample['position'] + \
-                       '_' + sample['sample'] + '_'
+            image_filename = f"{sample['if_plate_id']}_{sample['position']}_{sample['sample']}_"
+            image_id = _ANTIBODY_PREFIX_RE.sub('', sample['antibody']) + '/' + image_filename
             if image_id not in self._sample_urlmap:
                 logger.error(image_id + ' not in sample map')
                 continue
 
-            image_filename = sample['if_plate_id'] + \
-                             '_' + sample['position'] + \
-                             '_' + sample['sample'] + '_'
-            for c in constants.COLORS:
-                sample_url = self._sample_urlmap[image_id]
-                (image_url_prefix,
-                 image_suffix) = self._get_image_prefix_suffix(sample_url)
-
+            # url prefix and suffix are the same for every color
+            (image_url_prefix,
+             image_suffix) = self._get_image_prefix_suffix(self._sample_urlmap[image_id])
+            for c, dir_prefix in color_prefixes:
                 yield (image_url_prefix + c + image_suffix,
-                       os.path.join(color_download_map[c],
-                                    image_filename + c + image_suffix))
+                       dir_prefix + image_filename + c + image_suffix)
 
 
 class CM4AIImageCopyTupleGenerator(object):
@@ -491,13 +556,10 @@ class CM4AIImageCopyTupleGenerator(object):
 
         :return:
         """
-        self._sample_urlmap = {}
-        for sample in self._samples_list:
-            image_id = re.sub('^HPA0*|^CAB0*', '', sample['antibody']) + '/' + \
-                       sample['filename']
-
-            self._sample_urlmap[image_id] = os.path.join(sample['linkprefix'],
-                                                         sample['filename'] + 'z01_blue.jpg')
+        self._sample_urlmap = {
+            f"{_ANTIBODY_PREFIX_RE.sub('', sample['antibody'])}/{sample['filename']}":
+                os.path.join(sample['linkprefix'], f"{sample['filename']}z01_blue.jpg")
+            for sample in self._samples_list}
 
         logger.debug(self._sample_urlmap)
 
@@ -535,24 +597,20 @@ class CM4AIImageCopyTupleGenerator(object):
         if self._sample_urlmap is None:
             self._populate_sample_urlmap()
 
+        # (color, destination directory with trailing separator) pairs
+        color_prefixes = tuple((c, os.path.join(color_download_map[c], ''))
+                               for c in constants.COLORS)
         for sample in self._samples_list:
-            image_id = re.sub('^HPA0*|^CAB0*', '', sample['antibody']) + '/' + \
-                       sample['if_plate_id'] + \
-                       '_' + sample['position'] + \
-                       '_' + sample['sample'] + '_'
+            image_filename = f"{sample['if_plate_id']}_{sample['position']}_{sample['sample']}_"
+            image_id = _ANTIBODY_PREFIX_RE.sub('', sample['antibody']) + '/' + image_filename
             if image_id not in self._sample_urlmap:
                 logger.error(image_id + ' not in sample map')
                 continue
 
-            image_filename = sample['if_plate_id'] + \
-                             '_' + sample['position'] + \
-                             '_' + sample['sample'] + '_'
-            for c in constants.COLORS:
-                sample_url = self._sample_urlmap[image_id]
-                (image_url_prefix,
-                 image_suffix) = self._get_image_prefix_suffix(sample_url)
-                basedir = os.path.dirname(image_url_prefix)
-
-                yield (os.path.join(basedir, c, image_filename + 'z01_' + c + image_suffix),
-                       os.path.join(color_download_map[c],
-                                    image_filename + c + image_suffix))
+            # url prefix and suffix are the same for every color
+            (image_url_prefix,
+             image_suffix) = self._get_image_prefix_suffix(self._sample_urlmap[image_id])
+            src_prefix = os.path.join(os.path.dirname(image_url_prefix), '')
+            for c, dir_prefix in color_prefixes:
+                yield (src_prefix + c + os.sep + image_filename + 'z01_' + c + image_suffix,
+                       dir_prefix + image_filename + c + image_suffix)
@@ -0,0 +1,154 @@
+import io
+import os
+import logging
+import contextlib
+import threading
+from cellmaps_utils.provenance import ProvenanceUtil
+
+try:
+    import click
+    from fairscape_cli.__main__ import cli as fairscape_cli
+except ImportError:  # pragma: no cover
+    fairscape_cli = None
+
+logger = logging.getLogger(__name__)
+
+# stdout and stderr are process wide and fairscape rewrites
+# ro-crate-metadata.json without locking so only one command
+# can be run in process at a time
+_RUN_LOCK = threading.Lock()
+
+_PATH_OPTIONS = ('--filepath', '--source-filepath',
+                 '--destination-filepath', '--schema')
+"""
+FAIRSCAPE-cli options whose values are paths that are resolved
+against the directory the command is run under
+"""
+
+
+class InProcessProvenanceUtil(ProvenanceUtil):
+    """
+    :py:class:`~cellmaps_utils.provenance.ProvenanceUtil` that runs
+    `FAIRSCAPE-cli <https://github.com/fairscape/fairscape-cli>`__
+    commands within this python process instead of starting
+    a new python interpreter for every registration. If
+    `fairscape-cli <https://pypi.org/project/fairscape-cli>`__ cannot be
+    imported, commands are run as separate processes
+
+    .. note::
+
+        **timeout** passed to :py:meth:`_run_cmd` is not supported for
+        commands run in process and is ignored. Instead of changing
+        the working directory of the whole process, relative paths
+        in commands are resolved against the directory the command
+        is run under and ``rocrate init`` is run as ``rocrate create``
+        on that directory
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Constructor
+
+        :param kwargs: Passed to
+                       :py:class:`~cellmaps_utils.provenance.ProvenanceUtil`
+        """
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def _resolve_path(cwd, path):
+        """
+        Resolves **path** against **cwd** as if the working
+        directory was **cwd**. Empty values and URLs are
+        returned unchanged
+
+        :param cwd: directory command is run under
+        :type cwd: str
+        :param path: path to resolve
+        :type path: str
+        :return: resolved path
+        :rtype: str
+        """
+        if not path or '://' in path:
+            return path
+        return os.path.join(cwd, path)
+
+    def _get_args_under_cwd(self, args, cwd):
+        """
+        Gets FAIRSCAPE-cli arguments **args** with relative paths
+        resolved against **cwd** so the command gives the same result
+        it would if run with **cwd** as working directory. ``rocrate init``,
+        which writes to the working directory, is converted to
+        ``rocrate create`` on **cwd**
+
+        :param args: FAIRSCAPE-cli arguments
+        :type args: list
+        :param cwd: directory command is run under. If ``None``
+                    **args** is returned unchanged
+        :type cwd: str
+        :return: arguments
+        :rtype: list
+        """
+        if cwd is None:
+            return args
+        cwd = os.path.abspath(cwd)
+        if args[:2] == ['rocrate', 'init']:
+            return ['rocrate', 'create'] + args[2:] + [cwd]
+
+        new_args = list(args)
+        for i in range(len(new_args) - 1):
+            if new_args[i] in _PATH_OPTIONS:
+                new_args[i + 1] = self._resolve_path(cwd, new_args[i + 1])
+        if len(new_args) > 2 and new_args[0] == 'rocrate' and\
+                new_args[1] in ('register', 'add'):
+            # last argument is path to rocrate
+            new_args[-1] = self._resolve_path(cwd, new_args[-1])
+        return new_args
+
+    def _run_cmd(self, cmd, cwd=None, timeout=360):
+        """
+        Runs FAIRSCAPE command in this process. Any other command,
+        or any command if fairscape-cli could not be imported, is passed
+        to :py:meth:`~cellmaps_utils.provenance.ProvenanceUtil._run_cmd`
+
+        .. note::
+
+            **timeout** is ignored for commands run in process and
+            commands run in process are serialized since
+            standard out and standard error are
+            changed for the duration of the command
+
+        :param cmd: command to run
+        :type cmd: list
+        :param cwd: current working directory
+        :type cwd: str
+        :param timeout: timeout in seconds before killing process
+        :type timeout: int or float
+        :return: (return code, standard out, standard error)
+        :rtype: tuple
+        """
+        if fairscape_cli is None or len(cmd) < 2 or cmd[1] != self._binary:
+            return super()._run_cmd(cmd, cwd=cwd, timeout=timeout)
+
+        logger.debug('Running command in process: %s', cmd)
+        out = io.StringIO()
+        err = io.StringIO()
+        args = self._get_args_under_cwd(cmd[2:], cwd)
+        with _RUN_LOCK, contextlib.redirect_stdout(out),\
+                contextlib.redirect_stderr(err):
+            try:
+                res = fairscape_cli.main(args=args,
+                                         prog_name='fairscape-cli',
+                                         standalone_mode=False)
+                exit_code = res if isinstance(res, int) else 0
+            except click.ClickException as ce:
+                ce.show(file=err)
+                exit_code = ce.exit_code
+            except SystemExit as se:
+                exit_code = se.code if isinstance(se.code, int) else 1
+            except Exception as e:
+                err.write(str(e))
+                exit_code = 1
+
+        if not self._raise_on_error and exit_code != 0:
+            self._log_fairscape_error(cmd, exit_code, err.getvalue(), cwd=cwd)
+        return exit_code, out.getvalue().rstrip(), err.getvalue()
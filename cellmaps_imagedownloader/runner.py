@@ -1,14 +1,21 @@
 #! /usr/bin/env python
 
 import os
-from multiprocessing import Pool
+import stat
+import asyncio
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import re
 import csv
 import shutil
 import logging
 import logging.config
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+from urllib.parse import urlsplit
 from datetime import date
 import warnings
 from tqdm import tqdm
@@ -17,9 +24,327 @@ from cellmaps_utils.provenance import ProvenanceUtil
 from cellmaps_utils import constants
 import cellmaps_imagedownloader
 from cellmaps_imagedownloader.exceptions import CellMapsImageDownloaderError
+from cellmaps_imagedownloader.provenance import InProcessProvenanceUtil
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+try:
+    import liburing
+except ImportError:  # pragma: no cover
+    liburing = None
 
 logger = logging.getLogger(__name__)
 
+_ANTIBODY_PREFIX_RE = re.compile(r'^(?:HPA0*|CAB0*)')
+
+MAX_HTTP_RETRIES = 5
+"""
+Number of times a request that failed to connect or to read
+a response is retried by the connection adapter before the
+failure is reported. Error responses, such as ``429`` and ``5xx``,
+are not retried by the adapter, but by
+:py:meth:`CellmapsImageDownloader._download_images`
+"""
+
+RETRY_BACKOFF_FACTOR = 0.5
+"""
+Backoff factor passed to :py:class:`urllib3.util.retry.Retry`
+"""
+
+HTTP_POOL_MAXSIZE = 64
+"""
+Maximum number of keep-alive connections kept per host by the
+session shared by download threads
+"""
+
+DOWNLOAD_TIMEOUT = (5, 30)
+"""
+`(connect, read)` timeouts in seconds used when downloading an image
+"""
+
+DOWNLOAD_BUFFER_SIZE = 1 << 20
+"""
+Size in bytes of the buffers used when writing output files
+"""
+
+PREALLOCATE_MIN_SIZE = 1 << 20
+"""
+Minimum size in bytes of a file before its space is preallocated.
+Smaller files, like most images, are written with a single write
+so preallocating them only adds a syscall
+"""
+
+PROGRESS_BAR_KWARGS = {'mininterval': 1.0,
+                       'miniters': 1000,
+                       'smoothing': 0.1}
+"""
+Keyword arguments passed to :py:class:`tqdm.tqdm` for the
+per image progress bars so the bar is redrawn at most once a
+second and only after every 1000 images
+"""
+
+_WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | \
+               getattr(os, 'O_BINARY', 0) | getattr(os, 'O_NOATIME', 0)
+
+_SESSION = None
+
+_SESSION_POOL_MAXSIZE = 0
+"""
+Number of keep-alive connections per host of the adapter
+mounted on :py:data:`_SESSION`. Updated under :py:data:`_SESSION_LOCK`
+"""
+
+_SESSION_LOCK = threading.Lock()
+
+
+def _get_session(pool_maxsize=HTTP_POOL_MAXSIZE):
+    """
+    Gets the :py:class:`requests.Session` shared by download threads,
+    creating it on first call. The session mounts
+    an :py:class:`~requests.adapters.HTTPAdapter` that retries
+    connection and read failures with exponential backoff, reusing the
+    already open connection where possible. Error responses are
+    returned as is, leaving their retry to
+    :py:meth:`CellmapsImageDownloader._download_images` so
+    the two retry layers do not multiply
+
+    :param pool_maxsize: Minimum number of keep-alive connections
+                         the session should keep per host. If the
+                         session keeps fewer, a larger adapter is mounted
+                         and the replaced adapter is closed
+    :type pool_maxsize: int
+    :return: session for downloads
+    :rtype: :py:class:`requests.Session`
+    """
+    global _SESSION
+    global _SESSION_POOL_MAXSIZE
+    session = _SESSION
+    if session is None or _SESSION_POOL_MAXSIZE < pool_maxsize:
+        with _SESSION_LOCK:
+            if _SESSION is None or _SESSION_POOL_MAXSIZE < pool_maxsize:
+                retry = Retry(total=MAX_HTTP_RETRIES,
+                              backoff_factor=RETRY_BACKOFF_FACTOR,
+                              allowed_methods=('GET',),
+                              respect_retry_after_header=False,
+                              raise_on_status=False)
+                adapter = HTTPAdapter(pool_maxsize=pool_maxsize,
+                                      max_retries=retry)
+                if _SESSION is None:
+                    _SESSION = requests.Session()
+                old_adapters = [_SESSION.adapters.get(prefix)
+                                for prefix in ('https://', 'http://')]
+                _SESSION.mount('https://', adapter)
+                _SESSION.mount('http://', adapter)
+                _SESSION_POOL_MAXSIZE = pool_maxsize
+                # release pools and keep-alive sockets of
+                # replaced adapters instead of waiting on gc
+                for old_adapter in set(a for a in old_adapters
+                                       if a is not None):
+                    old_adapter.close()
+            session = _SESSION
+    return session
+
+
+def _preallocate(fd, size):
+    """
+    Reserves **size** bytes for file open as **fd** with
+    :py:func:`os.posix_fallocate` so the file is laid out in
+    as few extents as possible. Nothing is done if **size** is less
+    than :py:const:`PREALLOCATE_MIN_SIZE`. Failures, such as the
+    filesystem not supporting preallocation, are ignored since the
+    write that follows will allocate the space anyway
+
+    :param fd: file descriptor open for writing
+    :type fd: int
+    :param size: number of bytes that will be written
+    :type size: int
+    """
+    if size < PREALLOCATE_MIN_SIZE or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError as e:
+        logger.debug('Unable to preallocate %d bytes: %s', size, e)
+
+
+def _open_for_write(destfile):
+    """
+    Opens **destfile** for writing with :py:data:`_WRITE_FLAGS`,
+    truncating it if it exists. ``O_NOATIME`` is only permitted
+    on files owned by the caller, so if opening an existing file
+    of another user, such as in a shared group writable directory,
+    fails with :py:class:`PermissionError` the open is retried
+    without ``O_NOATIME``
+
+    :param destfile: path to open
+    :type destfile: str
+    :return: file descriptor open for writing
+    :rtype: int
+    """
+    try:
+        return os.open(destfile, _WRITE_FLAGS, 0o644)
+    except PermissionError:
+        noatime = getattr(os, 'O_NOATIME', 0)
+        if noatime == 0:
+            raise
+        return os.open(destfile, _WRITE_FLAGS & ~noatime, 0o644)
+
+
+def _write_bytes_to_file(data, destfile):
+    """
+    Writes **data** to **destfile** with unbuffered writes, normally
+    a single :py:func:`os.write` call. The space needed by large files
+    is preallocated via :py:func:`_preallocate`, the file is opened with ``O_NOATIME``
+    where available and, once written, the kernel is advised
+    the pages are not needed so downloaded images do not
+    evict other data from the page cache
+
+    :param data: data to write
+    :type data: bytes
+    :param destfile: path to write to
+    :type destfile: str
+    """
+    fd = _open_for_write(destfile)
+    try:
+        _preallocate(fd, len(data))
+        with memoryview(data) as view:
+            num_written = 0
+            while num_written < len(view):
+                num_written += os.write(fd, view[num_written:])
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def _is_existing_image(destfile):
+    """
+    Checks if **destfile** exists with a size greater then 0 bytes
+
+    :param destfile: path to file
+    :type destfile: str
+    :return: ``True`` if file exists and is not empty
+    :rtype: bool
+    """
+    try:
+        st = os.stat(destfile)
+    except OSError:
+        return False
+    return stat.S_ISREG(st.st_mode) and st.st_size > 0
+
+
+def _remove_existing_images(download_list):
+    """
+    `Generator function <https://docs.python.org/3/glossary.html#index-19>`__
+    that yields entries from **download_list** whose destination file
+    does not already exist with a size greater then 0 bytes. Each
+    destination directory is listed once with :py:func:`os.scandir`,
+    when the first entry for that directory is seen, so destination
+    files that do not exist cost no system calls and only existing
+    files in **download_list** are stat'ed
+
+    :param download_list: Each tuple of format `(image URL, dest file path)`
+    :type download_list: iterable of tuple
+    :return: entries in **download_list** that still need to be downloaded
+    :rtype: tuple
+    """
+    dir_listings = {}
+    num_skipped = 0
+    for entry in download_list:
+        dest_dir, file_name = os.path.split(entry[1])
+        listing = dir_listings.get(dest_dir)
+        if listing is None:
+            try:
+                with os.scandir(dest_dir if dest_dir else '.') as it:
+                    listing = {dir_entry.name: dir_entry for dir_entry in it}
+            except OSError as e:
+                logger.debug('Unable to scan %s : %s', dest_dir, e)
+                listing = {}
+            dir_listings[dest_dir] = listing
+        # is_file() uses the file type from the listing so only files
+        # being downloaded that exist are stat'ed to get their size
+        dir_entry = listing.get(file_name)
+        if dir_entry is not None and dir_entry.is_file() and \
+                dir_entry.stat().st_size > 0:
+            num_skipped += 1
+            continue
+        yield entry
+    if num_skipped > 0:
+        logger.info('Skipped %d images that already exist', num_skipped)
+
+
+def _get_num_to_download(download_list, total):
+    """
+    Gets number of images to download
+
+    :param download_list: Each tuple of format `(image URL, dest file path)`
+    :type download_list: iterable of tuple
+    :param total: Number of entries in **download_list** if known
+    :type total: int
+    :return: **total** if set, otherwise length of **download_list** or
+             ``None`` if **download_list** has no length
+    :rtype: int
+    """
+    if total is not None:
+        return total
+    try:
+        return len(download_list)
+    except TypeError:
+        return None
+
+
+def _close_progress_bar(t):
+    """
+    Closes progress bar **t** setting its total to the number of
+    images processed, which can be less then the total passed in
+    if images were skipped
+
+    :param t: progress bar
+    :type t: :py:class:`tqdm.tqdm`
+    """
+    if t.total != t.n:
+        t.total = t.n
+        t.refresh()
+    t.close()
+
+
+def _get_image_data(downloadtuple):
+    """
+    Gets body of image pointed to by download link in
+    **downloadtuple** without writing it to disk
+
+    :param downloadtuple: `(download link, dest file path)`
+    :type downloadtuple: tuple
+    :return: `(image data, None)` upon success otherwise
+             `(None, (requests status code, text from request, downloadtuple))`
+             using the same error codes as :py:func:`download_file`.
+             A response with an empty body fails with status code ``204``
+    :rtype: tuple
+    """
+    try:
+        with _get_session().get(downloadtuple[0],
+                                timeout=DOWNLOAD_TIMEOUT) as r:
+            if r.status_code != 200:
+                return None, (r.status_code, r.text, downloadtuple)
+            if len(r.content) == 0:
+                # never write an empty image, skip_existing
+                # would not treat it as already downloaded
+                return None, (204, 'empty body', downloadtuple)
+            return r.content, None
+    except requests.exceptions.HTTPError as e:
+        return None, (-1, str(e), downloadtuple)
+    except requests.exceptions.ConnectionError as e:
+        return None, (-2, str(e), downloadtuple)
+    except requests.exceptions.Timeout as e:
+        return None, (-3, str(e), downloadtuple)
+    except requests.exceptions.RequestException as e:
+        return None, (-4, str(e), downloadtuple)
+    except Exception as e:
+        return None, (-5, str(e), downloadtuple)
+
 
 def download_file_skip_existing(downloadtuple):
     """
@@ -33,7 +358,7 @@ def download_file_skip_existing(downloadtuple):
              (requests status code, text from request, downloadtuple)
     :rtype: tuple
     """
-    if os.path.isfile(downloadtuple[1]) and os.path.getsize(downloadtuple[1]) > 0:
+    if _is_existing_image(downloadtuple[1]):
         return None
     return download_file(downloadtuple)
 
@@ -50,29 +375,26 @@ def download_file(downloadtuple):
     :param downloadtuple: `(download link, dest file path)`
     :type downloadtuple: tuple
     :return: None upon success otherwise:
-             `(requests status code, text from request, downloadtuple)`
+             `(requests status code, text from request, downloadtuple)`.
+             If the server returns an empty image, no file is written
+             and status code is ``204``
     :rtype: tuple
     """
-    logger.debug('Downloading ' + downloadtuple[0] + ' to ' + downloadtuple[1])
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    if debug_enabled:
+        logger.debug('Downloading %s to %s', downloadtuple[0], downloadtuple[1])
+    # images are small enough to hold in memory which
+    # lets the whole image be written with one system call
+    data, res = _get_image_data(downloadtuple)
+    if res is not None:
+        return res
     try:
-        with requests.get(downloadtuple[0], stream=True) as r:
-            if r.status_code != 200:
-                return r.status_code, r.text, downloadtuple
-            with open(downloadtuple[1], 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:  # filter out keep-alive new chunks
-                        f.write(chunk)
-        return None
-    except requests.exceptions.HTTPError as e:
-        return -1, str(e), downloadtuple
-    except requests.exceptions.ConnectionError as e:
-        return -2, str(e), downloadtuple
-    except requests.exceptions.Timeout as e:
-        return -3, str(e), downloadtuple
-    except requests.exceptions.RequestException as e:
-        return -4, str(e), downloadtuple
+        _write_bytes_to_file(data, downloadtuple[1])
     except Exception as e:
         return -5, str(e), downloadtuple
+    if debug_enabled:
+        logger.debug('Wrote %d bytes to %s', len(data), downloadtuple[1])
+    return None
 
 
 class ImageDownloader(object):
@@ -87,14 +409,17 @@ class ImageDownloader(object):
         """
         pass
 
-    def download_images(self, download_list=None):
+    def download_images(self, download_list=None, total=None):
         """
         Subclasses should implement
 
-        :param download_list: list of tuples where first element is
+        :param download_list: tuples where first element is
                               full URL of image to download and 2nd
                               element is destination path
-        :type download_list: list
+        :type download_list: iterable of tuple
+        :param total: Number of entries in **download_list**, used for
+                      progress reporting when **download_list** is a generator
+        :type total: int
         :return:
         """
         raise CellMapsImageDownloaderError('Subclasses should implement this')
@@ -111,24 +436,32 @@ class CM4AICopyDownloader(ImageDownloader):
         """
         super().__init__()
 
-    def download_images(self, download_list=None):
+    def download_images(self, download_list=None, total=None):
         """
-        Subclasses should implement
+        Copies images
 
-        :param download_list: list of tuples where first element is
-                              full URL of image to download and 2nd
+        :param download_list: tuples where first element is
+                              full path of image to copy and 2nd
                               element is destination path
-        :type download_list: list
+        :type download_list: iterable of tuple
+        :param total: Number of entries in **download_list**
+        :type total: int
         :return:
         """
-        num_to_copy = len(download_list)
-        logger.info(str(num_to_copy) + ' images to copy')
+        num_to_copy = _get_num_to_download(download_list, total)
+        if num_to_copy is not None:
+            logger.info('%d images to copy', num_to_copy)
         t = tqdm(total=num_to_copy, desc='Copy',
-                 unit='images')
+                 unit='images', **PROGRESS_BAR_KWARGS)
+        completed = 0
         for entry in download_list:
-            t.update()
             shutil.copy(entry[0], entry[1])
-
+            completed += 1
+            if completed >= MultiProcessImageDownloader.PROGRESS_UPDATE_BATCH:
+                t.update(completed)
+                completed = 0
+        t.update(completed)
+        _close_progress_bar(t)
         return []
 
 
@@ -152,19 +485,23 @@ class FakeImageDownloader(ImageDownloader):
                       'You have been warned!!!\n'
                       'Have a nice day')
 
-    def download_images(self, download_list=None):
+    def download_images(self, download_list=None, total=None):
         """
         Downloads 1st image from server and then
         and makes renamed copies for subsequent images
 
         :param download_list:
-        :type download_list: list of tuple
+        :type download_list: iterable of tuple
+        :param total: Ignored, **download_list** is always
+                      converted to a list
+        :type total: int
         :return:
         """
+        download_list = list(download_list)
         num_to_download = len(download_list)
-        logger.info(str(num_to_download) + ' images to download')
+        logger.info('%d images to download', num_to_download)
         t = tqdm(total=num_to_download, desc='Download',
-                 unit='images')
+                 unit='images', **PROGRESS_BAR_KWARGS)
 
         src_image_dict = {}
         # assume 1st four images are the colors for the first image
@@ -187,11 +524,17 @@ class FakeImageDownloader(ImageDownloader):
 
 class MultiProcessImageDownloader(ImageDownloader):
     """
-    Uses multiprocess package to download images in parallel
+    Uses a pool of threads to download images in parallel
 
     """
     POOL_SIZE = 4
 
+    PROGRESS_UPDATE_BATCH = 64
+    """
+    Number of completed downloads to accumulate before
+    updating the progress bar
+    """
+
     def __init__(self, poolsize=POOL_SIZE, skip_existing=False,
                  override_dfunc=None):
         """
@@ -213,14 +556,49 @@ class MultiProcessImageDownloader(ImageDownloader):
         """
         super().__init__()
         self._poolsize = poolsize
+        self._skip_existing = False
         if override_dfunc is not None:
             self._dfunc = override_dfunc
         else:
             self._dfunc = download_file
             if skip_existing is True:
-                self._dfunc = download_file_skip_existing
+                self._skip_existing = True
 
-    def download_images(self, download_list=None):
+    def _get_chunksize(self, num_to_download):
+        """
+        Gets number of downloads to hand to a worker thread at
+        once so the per task overhead of the pool is amortized
+        over several downloads while still giving each
+        thread several chunks to balance load
+
+        :param num_to_download: Number of images to download or ``None``
+                                if not known
+        :type num_to_download: int
+        :return: Number of downloads per task, between ``1`` and
+                 ``256``, or ``64`` if **num_to_download** is ``None``
+        :rtype: int
+        """
+        if num_to_download is None:
+            return 64
+        return max(1, min(256, num_to_download // (self._poolsize * 4)))
+
+    def _download_chunk(self, entries):
+        """
+        Downloads each entry in **entries**
+
+        :param entries: Each tuple of format `(image URL, dest file path)`
+        :type entries: list of tuple
+        :return: Failed downloads
+        :rtype: list of tuple
+        """
+        failed = []
+        for entry in entries:
+            res = self._dfunc(entry)
+            if res is not None:
+                failed.append(res)
+        return failed
+
+    def download_images(self, download_list=None, total=None):
         """
         Downloads images returning a list of failed downloads
 
@@ -234,39 +612,500 @@ class MultiProcessImageDownloader(ImageDownloader):
                        '/tmp/1_A1_1_red.jpg')]
             failed = dloader.download_images(download_list=d_list)
 
+        **download_list** can be a generator, in which case it is consumed
+        as downloads progress so only a bounded number of entries are held
+        in memory
+
         :param download_list: Each tuple of format `(image URL, dest file path)`
-        :type download_list: list of tuple
+        :type download_list: iterable of tuple
+        :param total: Number of entries in **download_list**, used for
+                      progress reporting when **download_list** is a generator
+        :type total: int
         :return: Failed downloads, format of tuple
                  (`http status code`, `text of error`, (`link`, `destfile`))
         :rtype: list of tuple
         """
         failed_downloads = []
-        logger.debug('Poolsize for image downloader set to: ' +
-                     str(self._poolsize))
-        num_to_download = len(download_list)
-        logger.info(str(num_to_download) + ' images to download')
+        logger.debug('Poolsize for image downloader set to: %d', self._poolsize)
+        # keep a connection per thread so none are discarded
+        _get_session(pool_maxsize=max(HTTP_POOL_MAXSIZE, self._poolsize))
+        num_to_download = _get_num_to_download(download_list, total)
+        if self._skip_existing:
+            download_list = _remove_existing_images(download_list)
+        if num_to_download is not None:
+            logger.info('%d images to download', num_to_download)
         t = tqdm(total=num_to_download, desc='Download',
-                 unit='images')
+                 unit='images', **PROGRESS_BAR_KWARGS)
+        # progress bar is updated in batches to avoid a
+        # refresh check for every completed download
+        completed = 0
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
         if self._poolsize <= 1:
-            for entry in download_list:
-                t.update()
-                res = self._dfunc(entry)
-                if res is not None:
-                    if logger.isEnabledFor(logging.DEBUG):
-                        logger.debug('Failed download: ' + str(res))
+            # downloads still go through _download_chunk so
+            # subclasses such as IoUringImageDownloader are used
+            entries = iter(download_list)
+            chunksize = self._get_chunksize(num_to_download)
+            while True:
+                chunk = list(itertools.islice(entries, chunksize))
+                if len(chunk) == 0:
+                    break
+                for res in self._download_chunk(chunk):
+                    if debug_enabled:
+                        logger.debug('Failed download: %s', res)
                     failed_downloads.append(res)
+                completed += len(chunk)
+                if completed >= MultiProcessImageDownloader.PROGRESS_UPDATE_BATCH:
+                    t.update(completed)
+                    completed = 0
         else:
-            with Pool(processes=self._poolsize) as pool:
-                for i in pool.imap_unordered(self._dfunc,
-                                             download_list):
-                    t.update()
-                    if i is not None:
-                        if logger.isEnabledFor(logging.DEBUG):
-                            logger.debug('Failed download: ' + str(i))
-                        failed_downloads.append(i)
-        t.close()
+            # downloads are network bound so threads suffice and
+            # share the keep-alive connections of one session
+            chunksize = self._get_chunksize(num_to_download)
+            entries = iter(download_list)
+            # limit chunks waiting in the pool so a generator
+            # passed in is not consumed faster then downloads complete
+            max_in_flight = self._poolsize * 4
+            with ThreadPoolExecutor(max_workers=self._poolsize) as executor:
+                in_flight = {}
+                while True:
+                    chunk = list(itertools.islice(entries, chunksize))
+                    if len(chunk) > 0:
+                        in_flight[executor.submit(self._download_chunk,
+                                                  chunk)] = len(chunk)
+                        if len(in_flight) < max_in_flight:
+                            continue
+                    if len(in_flight) == 0:
+                        break
+                    done, not_done = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        completed += in_flight.pop(future)
+                        for i in future.result():
+                            if debug_enabled:
+                                logger.debug('Failed download: %s', i)
+                            failed_downloads.append(i)
+                    if completed >= MultiProcessImageDownloader.PROGRESS_UPDATE_BATCH:
+                        t.update(completed)
+                        completed = 0
+        t.update(completed)
+        _close_progress_bar(t)
+        return failed_downloads
+
+
+class IoUringImageDownloader(MultiProcessImageDownloader):
+    """
+    Downloads images with a pool of threads like
+    :py:class:`MultiProcessImageDownloader`, but instead of
+    each thread writing its images with blocking writes,
+    the body of each image is fetched into memory and
+    written via a single write request on an
+    `io_uring <https://kernel.dk/io_uring.pdf>`__ ring.
+    Write requests are submitted to the kernel in batches of
+    :py:const:`SUBMIT_BATCH` images so one system call
+    covers the writes of many images. Where the kernel supports
+    it (Linux 5.19+), the files of each batch are registered with
+    the ring so the writes do not each have to look up and
+    reference count their file descriptor.
+
+    Requires Linux 5.6+ and the optional
+    `liburing <https://pypi.org/project/liburing>`__ package
+    (``pip install cellmaps_imagedownloader[iouring]``)
+
+    """
+    SUBMIT_BATCH = 32
+    """
+    Number of image writes queued on the ring before
+    they are submitted to the kernel
+    """
+
+    _SUPPORTED = None
+
+    def __init__(self, poolsize=MultiProcessImageDownloader.POOL_SIZE,
+                 skip_existing=False):
+        """
+        Constructor
+
+        :param poolsize: Number of concurrent downloaders to use.
+        :type poolsize: int
+        :param skip_existing: If ``True`` skip download if image file exists and has size
+                              greater then ``0``
+        :type skip_existing: bool
+        :raises CellMapsImageDownloaderError: If io_uring is not available
+        """
+        if not IoUringImageDownloader.is_available():
+            raise CellMapsImageDownloaderError('liburing package and Linux 5.6+ '
+                                               'are required for '
+                                               'IoUringImageDownloader')
+        super().__init__(poolsize=poolsize, skip_existing=skip_existing)
+        self._thread_rings = threading.local()
+        self._rings = []
+        self._rings_lock = threading.Lock()
+
+    @staticmethod
+    def is_available():
+        """
+        Checks if `liburing <https://pypi.org/project/liburing>`__ is
+        installed and the kernel supports io_uring writes. The
+        kernel is only probed on the first call
+
+        :return: ``True`` if io_uring can be used
+        :rtype: bool
+        """
+        if liburing is None:
+            return False
+        if IoUringImageDownloader._SUPPORTED is None:
+            ring = liburing.Ring()
+            try:
+                liburing.io_uring_queue_init(1, ring, 0)
+            except OSError as e:
+                logger.debug('Unable to create io_uring: %s', e)
+                IoUringImageDownloader._SUPPORTED = False
+                return False
+            try:
+                probe = liburing.io_uring_get_probe_ring(ring)
+                try:
+                    IoUringImageDownloader._SUPPORTED = \
+                        liburing.io_uring_opcode_supported(probe,
+                                                           liburing.io_uring_op.IORING_OP_WRITE)
+                finally:
+                    liburing.io_uring_free_probe(probe)
+            finally:
+                liburing.io_uring_queue_exit(ring)
+        return IoUringImageDownloader._SUPPORTED
+
+    def _download_chunk(self, entries):
+        """
+        Downloads each entry in **entries**, writing the images
+        via io_uring
+
+        :param entries: Each tuple of format `(image URL, dest file path)`
+        :type entries: list of tuple
+        :return: Failed downloads
+        :rtype: list of tuple
+        """
+        failed = []
+        ring = self._get_ring()
+        fixed_files = self._thread_rings.fixed_files
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        pending = []
+        for entry in entries:
+            if debug_enabled:
+                logger.debug('Downloading %s to %s', entry[0], entry[1])
+            data, res = _get_image_data(entry)
+            if res is not None:
+                failed.append(res)
+                continue
+            try:
+                fd = _open_for_write(entry[1])
+            except OSError as e:
+                failed.append((-5, str(e), entry))
+                continue
+            _preallocate(fd, len(data))
+            sqe = liburing.io_uring_get_sqe(ring)
+            if fixed_files:
+                # file is referenced by its index in the registered
+                # file table which is filled in by _submit_writes()
+                liburing.io_uring_prep_write(sqe, len(pending), data, 0)
+                liburing.io_uring_sqe_set_flags(sqe, liburing.IOSQE_FIXED_FILE)
+            else:
+                liburing.io_uring_prep_write(sqe, fd, data, 0)
+            liburing.io_uring_sqe_set_data64(sqe, len(pending))
+            pending.append((fd, data, entry))
+            if len(pending) >= IoUringImageDownloader.SUBMIT_BATCH:
+                failed.extend(self._submit_writes(ring, pending,
+                                                  fixed_files=fixed_files))
+                pending = []
+        if len(pending) > 0:
+            failed.extend(self._submit_writes(ring, pending,
+                                              fixed_files=fixed_files))
+        return failed
+
+    def _get_ring(self):
+        """
+        Gets the io_uring ring of the calling thread, creating it
+        on first call. Since each ring is only used by the thread that
+        created it, the ring is set up with ``IORING_SETUP_SINGLE_ISSUER``
+        and ``IORING_SETUP_DEFER_TASKRUN`` so completion work is done
+        when the thread waits for completions instead of interrupting
+        it. Kernels older then 6.1 do not support these flags in which
+        case the ring is created without them.
+
+        A sparse table of :py:const:`SUBMIT_BATCH` files is also
+        registered with the ring, if supported, and
+        ``fixed_files`` of the thread local storage is set to ``True``
+
+        :return: ring for calling thread
+        :rtype: :py:class:`liburing.Ring`
+        """
+        ring = getattr(self._thread_rings, 'ring', None)
+        if ring is not None:
+            return ring
+        ring = liburing.Ring()
+        try:
+            liburing.io_uring_queue_init(IoUringImageDownloader.SUBMIT_BATCH, ring,
+                                         liburing.IORING_SETUP_SINGLE_ISSUER |
+                                         liburing.IORING_SETUP_DEFER_TASKRUN)
+        except OSError:
+            liburing.io_uring_queue_init(IoUringImageDownloader.SUBMIT_BATCH,
+                                         ring, 0)
+        try:
+            liburing.io_uring_register_files_sparse(ring,
+                                                    IoUringImageDownloader.SUBMIT_BATCH)
+            self._thread_rings.fixed_files = True
+        except OSError as e:
+            logger.debug('Unable to register files with io_uring: %s', e)
+            self._thread_rings.fixed_files = False
+        with self._rings_lock:
+            self._rings.append(ring)
+        self._thread_rings.ring = ring
+        return ring
+
+    def download_images(self, download_list=None, total=None):
+        """
+        Downloads images returning a list of failed downloads.
+        Each worker thread writes via its own ring which
+        is freed once all downloads are done
+
+        :param download_list: Each tuple of format `(image URL, dest file path)`
+        :type download_list: iterable of tuple
+        :param total: Number of entries in **download_list**, used for
+                      progress reporting when **download_list** is a generator
+        :type total: int
+        :return: Failed downloads, format of tuple
+                 (`http status code`, `text of error`, (`link`, `destfile`))
+        :rtype: list of tuple
+        """
+        self._thread_rings = threading.local()
+        self._rings = []
+        self._rings_lock = threading.Lock()
+        try:
+            return super().download_images(download_list=download_list,
+                                           total=total)
+        finally:
+            for ring in self._rings:
+                liburing.io_uring_queue_exit(ring)
+            self._rings = []
+
+    def _submit_writes(self, ring, pending, fixed_files=False):
+        """
+        Submits writes queued on **ring** and waits for them to
+        complete, closing the file descriptors in **pending**.
+        Short writes are completed with :py:func:`os.write`
+
+        :param ring: ring with write requests queued, the user data
+                     of each request is its index in **pending**
+        :type ring: :py:class:`liburing.Ring`
+        :param pending: `(file descriptor, data, downloadtuple)` for
+                        each queued write request
+        :type pending: list of tuple
+        :param fixed_files: If ``True`` the write requests reference
+                            files by their index in **pending** and
+                            the file descriptors are first set in
+                            the ring's registered file table
+        :type fixed_files: bool
+        :return: Failed downloads
+        :rtype: list of tuple
+        """
+        failed = []
+        results = {}
+        if fixed_files:
+            # replaces the files of the previous batch in one system call,
+            # fds must stay referenced until the writes complete
+            fds = liburing.FileIndex([x[0] for x in pending])
+            try:
+                liburing.io_uring_register_files_update(ring, fds, 0)
+            except OSError as e:
+                # writes are still submitted and fail, closing the files
+                logger.error('Unable to update io_uring registered files: %s', e)
+        cqe = liburing.Cqe()
+        remaining = len(pending)
+        while remaining > 0:
+            liburing.io_uring_submit_and_wait(ring, remaining)
+            liburing.io_uring_peek_cqe(ring, cqe)
+            ready = liburing.io_uring_cq_ready(ring)
+            for i in range(ready):
+                completion = cqe[i]
+                index = completion.user_data
+                try:
+                    results[index] = completion.res
+                except OSError as e:
+                    # liburing raises for a negative result
+                    results[index] = e
+            liburing.io_uring_cq_advance(ring, ready)
+            remaining -= ready
+
+        for index, (fd, data, downloadtuple) in enumerate(pending):
+            try:
+                num_written = results[index]
+                if isinstance(num_written, OSError):
+                    raise num_written
+                with memoryview(data) as view:
+                    while num_written < len(view):
+                        num_written += os.write(fd, view[num_written:])
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError as e:
+                failed.append((-5, str(e), downloadtuple))
+            finally:
+                os.close(fd)
+        return failed
+
+
+class AsyncImageDownloader(ImageDownloader):
+    """
+    Uses :py:mod:`asyncio` and `aiohttp <https://docs.aiohttp.org>`__
+    to keep many downloads in flight from a single thread over
+    one pool of connections
+
+    .. note::
+
+        Requires the optional `aiohttp <https://pypi.org/project/aiohttp>`__
+        package
+
+    """
+    MIN_POOLSIZE = 32
+    """
+    Smallest poolsize for which this downloader is
+    preferred over :py:class:`~MultiProcessImageDownloader`
+    """
+
+    def __init__(self, poolsize=MIN_POOLSIZE, skip_existing=False):
+        """
+        Constructor
+
+        :param poolsize: Maximum number of concurrent downloads
+        :type poolsize: int
+        :param skip_existing: If ``True`` skip download if image file exists and has size
+                              greater then ``0``
+        :type skip_existing: bool
+        :raises CellMapsImageDownloaderError: If aiohttp is not installed
+        """
+        super().__init__()
+        if not AsyncImageDownloader.is_available():
+            raise CellMapsImageDownloaderError('aiohttp package is required '
+                                               'for AsyncImageDownloader')
+        self._poolsize = poolsize
+        self._skip_existing = skip_existing
+
+    @staticmethod
+    def is_available():
+        """
+        Denotes if `aiohttp <https://pypi.org/project/aiohttp>`__
+        is installed which is needed by this downloader
+
+        :return: ``True`` if this downloader can be used
+        :rtype: bool
+        """
+        return aiohttp is not None
+
+    def download_images(self, download_list=None, total=None):
+        """
+        Downloads images returning a list of failed downloads
+
+        :param download_list: Each tuple of format `(image URL, dest file path)`
+        :type download_list: iterable of tuple
+        :param total: Number of entries in **download_list**, used for
+                      progress reporting when **download_list** is a generator
+        :type total: int
+        :return: Failed downloads, format of tuple
+                 (`http status code`, `text of error`, (`link`, `destfile`))
+        :rtype: list of tuple
+        """
+        logger.debug('Poolsize for image downloader set to: %d', self._poolsize)
+        num_to_download = _get_num_to_download(download_list, total)
+        if self._skip_existing:
+            download_list = _remove_existing_images(download_list)
+        if num_to_download is not None:
+            logger.info('%d images to download', num_to_download)
+        t = tqdm(total=num_to_download, desc='Download',
+                 unit='images', **PROGRESS_BAR_KWARGS)
+        try:
+            return asyncio.run(self._download_all(download_list, t))
+        finally:
+            _close_progress_bar(t)
+
+    async def _download_all(self, download_list, t):
+        """
+        Downloads all entries in **download_list** updating
+        progress bar **t** as downloads complete. **poolsize**
+        worker tasks take entries from **download_list** as they
+        finish their previous download so **download_list** is
+        consumed as downloads progress
+
+        :param download_list: Each tuple of format `(image URL, dest file path)`
+        :type download_list: iterable of tuple
+        :param t: progress bar
+        :type t: :py:class:`tqdm.tqdm`
+        :return: Failed downloads
+        :rtype: list of tuple
+        """
+        failed_downloads = []
+        entries = iter(download_list)
+        completed = 0
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        # images all come from one host so limit connections
+        # per host as well as overall
+        connector = aiohttp.TCPConnector(limit=self._poolsize,
+                                         limit_per_host=self._poolsize,
+                                         ttl_dns_cache=600)
+        timeout = aiohttp.ClientTimeout(sock_connect=DOWNLOAD_TIMEOUT[0],
+                                        sock_read=DOWNLOAD_TIMEOUT[1])
+
+        async def _worker(session):
+            nonlocal completed
+            # entries is shared by all workers, which is safe
+            # since they all run in the event loop thread
+            for entry in entries:
+                res = await self._download(session, entry)
+                completed += 1
+                if completed >= MultiProcessImageDownloader.PROGRESS_UPDATE_BATCH:
+                    t.update(completed)
+                    completed = 0
+                if res is not None:
+                    if debug_enabled:
+                        logger.debug('Failed download: %s', res)
+                    failed_downloads.append(res)
+
+        async with aiohttp.ClientSession(connector=connector,
+                                         timeout=timeout) as session:
+            await asyncio.gather(*[_worker(session)
+                                   for x in range(self._poolsize)])
+        t.update(completed)
         return failed_downloads
 
+    async def _download(self, session, downloadtuple):
+        """
+        Downloads file in **downloadtuple**. The response body is read
+        in the event loop and written to disk in the default executor
+
+        :param session: session to download with
+        :type session: :py:class:`aiohttp.ClientSession`
+        :param downloadtuple: `(download link, dest file path)`
+        :type downloadtuple: tuple
+        :return: None upon success otherwise:
+                 `(http status code, text from request, downloadtuple)`
+        :rtype: tuple
+        """
+        try:
+            async with session.get(downloadtuple[0]) as r:
+                if r.status != 200:
+                    return r.status, await r.text(), downloadtuple
+                data = await r.read()
+            if len(data) == 0:
+                return 204, 'empty body', downloadtuple
+            await asyncio.get_running_loop().run_in_executor(None, _write_bytes_to_file,
+                                                             data, downloadtuple[1])
+            return None
+        except aiohttp.ClientResponseError as e:
+            return -1, str(e), downloadtuple
+        except asyncio.TimeoutError as e:
+            return -3, str(e), downloadtuple
+        except aiohttp.ClientConnectionError as e:
+            return -2, str(e), downloadtuple
+        except aiohttp.ClientError as e:
+            return -4, str(e), downloadtuple
+        except Exception as e:
+            return -5, str(e), downloadtuple
+
 
 class CellmapsImageDownloader(object):
     """
@@ -280,6 +1119,11 @@ class CellmapsImageDownloader(object):
     SAMPLES_FILEKEY = 'samples'
     UNIQUE_FILEKEY = 'unique'
     IMG_SUFFIX = '.jpg'
+    MAX_RETRY_WAIT = 60
+    """
+    Maximum seconds to wait before retrying downloads that
+    were rate limited or failed with a server error
+    """
 
     def __init__(self, outdir=None,
                  imgsuffix=IMG_SUFFIX,
@@ -289,7 +1133,7 @@ class CellmapsImageDownloader(object):
                  skip_logging=True,
                  provenance=None,
                  input_data_dict=None,
-                 provenance_utils=ProvenanceUtil(),
+                 provenance_utils=None,
                  skip_failed=False,
                  existing_outdir=False):
         """
@@ -313,7 +1157,10 @@ class CellmapsImageDownloader(object):
         :type input_data_dict: dict
         :param provenance_utils: Wrapper for `fairscape-cli <https://pypi.org/project/fairscape-cli>`__
                                  which is used for
-                                 `RO-Crate <https://www.researchobject.org/ro-crate>`__ creation and population
+                                 `RO-Crate <https://www.researchobject.org/ro-crate>`__ creation and population.
+                                 If ``None``, a new
+                                 :py:class:`~cellmaps_imagedownloader.provenance.InProcessProvenanceUtil`
+                                 is created for this instance
         :type provenance_utils: :py:class:`~cellmaps_utils.provenance.ProvenanceUtil`
         """
         if outdir is None:
@@ -335,10 +1182,14 @@ class CellmapsImageDownloader(object):
         self._unique_datasetid = None
         self._softwareid = None
         self._image_gene_attrid = None
-        self._provenance_utils = provenance_utils
+        if provenance_utils is None:
+            self._provenance_utils = InProcessProvenanceUtil()
+        else:
+            self._provenance_utils = provenance_utils
         self._skip_failed = skip_failed
         self._image_dataset_ids = None
         self._existing_outdir = existing_outdir
+        self._color_download_map = None
 
         if self._input_data_dict is None:
             self._input_data_dict = {'outdir': self._outdir,
@@ -428,17 +1279,15 @@ class CellmapsImageDownloader(object):
         :raises CellmapsDownloaderError: If output directory is None or if directory already exists
         """
         if not self._existing_outdir:
-            if os.path.isdir(self._outdir):
-                raise CellMapsImageDownloaderError(self._outdir + ' already exists')
-            else:
+            try:
                 os.makedirs(self._outdir, mode=0o755)
+            except FileExistsError:
+                raise CellMapsImageDownloaderError(self._outdir + ' already exists')
 
         for cur_color in constants.COLORS:
             cdir = os.path.join(self._outdir, cur_color)
-            if not os.path.isdir(cdir):
-                logger.debug('Creating directory: ' + cdir)
-                os.makedirs(cdir,
-                            mode=0o755)
+            logger.debug('Creating directory: %s', cdir)
+            os.makedirs(cdir, mode=0o755, exist_ok=True)
 
     def _register_software(self):
         """
@@ -551,6 +1400,29 @@ class CellmapsImageDownloader(object):
         except KeyError as ke:
             raise CellMapsImageDownloaderError('Key missing in provenance: ' + str(ke))
 
+    def _hardlink_to_outdir(self, source_file):
+        """
+        Creates a hard link to **source_file** in the output directory
+        so the file can be registered without copying its contents.
+        This is only possible if **source_file** resides on the same
+        filesystem as the output directory
+
+        :param source_file: Path to file to link
+        :type source_file: str
+        :return: path to hard link or ``None`` if link could not be created
+        :rtype: str
+        """
+        dest_file = os.path.join(self._outdir, os.path.basename(source_file))
+        try:
+            if os.stat(source_file).st_dev != os.stat(self._outdir).st_dev:
+                return None
+            os.link(source_file, dest_file)
+        except OSError as e:
+            logger.debug('Unable to hard link %s, falling back to copy: %s',
+                         source_file, e)
+            return None
+        return dest_file
+
     def _register_samples_dataset(self):
         """
 
@@ -574,13 +1446,18 @@ class CellmapsImageDownloader(object):
             skip_samples_copy = False
             if os.path.exists(os.path.join(self._outdir, 'samples.csv')):
                 skip_samples_copy = True
+            else:
+                linked_file = self._hardlink_to_outdir(os.path.abspath(samples_file))
+                if linked_file is not None:
+                    samples_file = linked_file
+                    skip_samples_copy = True
 
         # add samples dataset
         self._samples_datasetid = self._add_dataset_to_crate(
             data_dict=self._provenance[CellmapsImageDownloader.SAMPLES_FILEKEY],
             source_file=os.path.abspath(samples_file),
             skip_copy=skip_samples_copy)
-        logger.debug('Samples dataset id: ' + str(self._samples_datasetid))
+        logger.debug('Samples dataset id: %s', self._samples_datasetid)
 
     def _register_unique_dataset(self):
         """
@@ -605,13 +1482,17 @@ class CellmapsImageDownloader(object):
         else:
             unique_file = self._input_data_dict[CellmapsImageDownloader.UNIQUE_FILEKEY]
             skip_unique_copy = False
+            linked_file = self._hardlink_to_outdir(os.path.abspath(unique_file))
+            if linked_file is not None:
+                unique_file = linked_file
+                skip_unique_copy = True
 
         # add unique dataset
         self._unique_datasetid = self._add_dataset_to_crate(
             data_dict=self._provenance[CellmapsImageDownloader.UNIQUE_FILEKEY],
             source_file=os.path.abspath(unique_file),
             skip_copy=skip_unique_copy)
-        logger.debug('Unique dataset id: ' + str(self._unique_datasetid))
+        logger.debug('Unique dataset id: %s', self._unique_datasetid)
 
     def _register_downloaded_images(self):
         """
@@ -627,13 +1508,16 @@ class CellmapsImageDownloader(object):
 
         self._image_dataset_ids = []
 
-        for c in constants.COLORS:
+        for c, color_dir in self._get_color_download_map().items():
             cntr = 0
-            for entry in tqdm(os.listdir(os.path.join(self._outdir, c)),
-                              desc='FAIRSCAPE ' + c + ' images registration'):
+            # outdir is absolute so paths can be built by concatenation
+            color_prefix = os.path.join(color_dir, '')
+            for entry in tqdm(os.listdir(color_dir),
+                              desc='FAIRSCAPE ' + c + ' images registration',
+                              **PROGRESS_BAR_KWARGS):
                 if not entry.endswith(self._imgsuffix):
                     continue
-                fullpath = os.path.join(self._outdir, c, entry)
+                fullpath = color_prefix + entry
                 data_dict['name'] = entry + ' ' + c + \
                                     ' channel image'
                 if len(data_dict['name']) >= 64:
@@ -656,27 +1540,41 @@ class CellmapsImageDownloader(object):
 
         ``{'red': '/tmp/foo/red'}``
 
+        The map is only built on the first call
+
         :return: map of colors to directory paths
         :rtype: dict
         """
-        color_d_map = {}
-        for c in constants.COLORS:
-            color_d_map[c] = os.path.join(self._outdir, c)
-        return color_d_map
+        if self._color_download_map is None:
+            self._color_download_map = {c: os.path.join(self._outdir, c)
+                                        for c in constants.COLORS}
+        return self._color_download_map
 
-    def _get_download_tuples(self):
+    def _iter_download_tuples(self):
         """
-        Gets download list from **imageurlgen** object set via constructor
+        `Generator function <https://docs.python.org/3/glossary.html#index-19>`__
+        that gets download tuples from **imageurlgen** object set via constructor
 
-        :return: list of (image download URL prefix,
-                          file path where image should be written)
-        :rtype: list
+        :return: (image download URL prefix,
+                  file path where image should be written)
+        :rtype: tuple
         """
-        dtuples = []
-        color_map = self._get_color_download_map()
-        for image_url, image_dest in self._imageurlgen.get_next_image_url(color_map):
-            dtuples.append((image_url, image_dest))
-        return dtuples
+        yield from self._imageurlgen.get_next_image_url(self._get_color_download_map())
+
+    def _get_num_download_tuples(self):
+        """
+        Gets expected number of tuples from :py:meth:`_iter_download_tuples`
+        which is one per color for each sample
+
+        :return: number of download tuples or ``None`` if unknown
+        :rtype: int
+        """
+        if self._imagegen is None:
+            return None
+        samples = self._imagegen.get_samples_list()
+        if samples is None:
+            return None
+        return len(constants.COLORS) * len(samples)
 
     def _write_task_start_json(self):
         """
@@ -695,27 +1593,88 @@ class CellmapsImageDownloader(object):
                                        version=cellmaps_imagedownloader.__version__,
                                        data=data)
 
-    def _retry_failed_images(self, failed_downloads=None):
+    @staticmethod
+    def _is_retryable(status_code):
+        """
+        Checks if a download that failed with **status_code** might
+        succeed if retried. Client errors (``4xx``), other then
+        timeouts (``408``) and rate limiting (``429``), will fail again
+        and are not retried
+
+        :param status_code: http status code or negative error code
+                            from :py:func:`download_file`
+        :type status_code: int
+        :return: ``True`` if download should be retried
+        :rtype: bool
+        """
+        if 400 <= status_code < 500:
+            return status_code in (408, 429)
+        return True
+
+    def _retry_failed_images(self, failed_downloads=None, retry_count=1):
         """
+        Retries downloads in **failed_downloads** that might succeed
+        on another attempt. If any download was rate limited (``429``)
+        or failed with a server error (``5xx``), this method first waits
+        ``min(MAX_RETRY_WAIT, 2 ** retry_count)`` seconds to give the
+        server time to recover. Downloads are retried grouped by host
 
-        :param failed_downloads:
-        :return:
+        :param failed_downloads: Failed downloads, format of tuple
+                 (`http status code`, `text of error`, (`link`, `destfile`))
+        :type failed_downloads: list of tuple
+        :param retry_count: Number of this retry starting at ``1``
+        :type retry_count: int
+        :return: Downloads that still failed, including the ones
+                 that were not retried
+        :rtype: list of tuple
         """
-        downloads_to_retry = []
+        retry_by_host = {}
+        permanent_failures = []
         error_code_map = {}
+        throttled_hosts = set()
         for entry in failed_downloads:
             if entry[0] not in error_code_map:
                 error_code_map[entry[0]] = 0
             error_code_map[entry[0]] += 1
-            downloads_to_retry.append(entry[2])
-        logger.debug('Failed download counts by http error code: ' + str(error_code_map))
-        return self._imagedownloader.download_images(downloads_to_retry)
+            if not CellmapsImageDownloader._is_retryable(entry[0]):
+                permanent_failures.append(entry)
+                continue
+            host = urlsplit(entry[2][0]).netloc
+            if entry[0] == 429 or entry[0] >= 500:
+                throttled_hosts.add(host)
+            retry_by_host.setdefault(host, []).append(entry[2])
+        logger.debug('Failed download counts by http error code: %s', error_code_map)
+        if len(retry_by_host) == 0:
+            return permanent_failures
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Downloads to retry by host: %s',
+                         {host: len(x) for host, x in retry_by_host.items()})
+        if len(throttled_hosts) > 0:
+            wait_time = min(CellmapsImageDownloader.MAX_RETRY_WAIT, 2 ** retry_count)
+            logger.info('Waiting %d seconds before retrying downloads from %s',
+                        wait_time, ', '.join(sorted(throttled_hosts)))
+            time.sleep(wait_time)
+
+        # downloads are grouped by host so requests to the same
+        # server reuse the connections kept open by the session
+        downloads_to_retry = [x for host_downloads in retry_by_host.values()
+                              for x in host_downloads]
+        return permanent_failures + self._imagedownloader.download_images(downloads_to_retry)
 
     def _download_images(self, max_retry=5):
         """
         Uses downloader specified in constructor to download images noted in
-        tsvfile file also specified in constructor
+        tsvfile file also specified in constructor.
+
+        Downloads that failed with a retryable status, see
+        :py:meth:`_is_retryable`, are retried up to **max_retry** times,
+        so each image is requested at most ``1 + max_retry`` times
+        (``6`` by default). Connection and read failures are in addition
+        retried up to :py:const:`MAX_HTTP_RETRIES` times by the
+        connection adapter within each of those attempts
 
+        :param max_retry: Maximum number of times failed downloads are retried
+        :type max_retry: int
         :raises CellMapsImageDownloaderError: if image downloader is ``None`` or
                                          if there are failed downloads
         :return: (int with value of 0 upon success otherwise failure, list of failed downloads)
@@ -724,17 +1683,19 @@ class CellmapsImageDownloader(object):
         if self._imagedownloader is None:
             raise CellMapsImageDownloaderError('Image downloader is None')
 
-        downloadtuples = self._get_download_tuples()
-
-        failed_downloads = self._imagedownloader.download_images(downloadtuples)
+        failed_downloads = self._imagedownloader.download_images(self._iter_download_tuples(),
+                                                                 total=self._get_num_download_tuples())
         retry_count = 0
-        while len(failed_downloads) > 0 and retry_count < max_retry:
+        while retry_count < max_retry and \
+                any(CellmapsImageDownloader._is_retryable(entry[0])
+                    for entry in failed_downloads):
             retry_count += 1
-            logger.error(str(len(failed_downloads)) +
-                         ' images failed to download. Retrying #' + str(retry_count))
+            logger.error('%d images failed to download. Retrying #%d',
+                         len(failed_downloads), retry_count)
 
             # try one more time with files that failed
-            failed_downloads = self._retry_failed_images(failed_downloads=failed_downloads)
+            failed_downloads = self._retry_failed_images(failed_downloads=failed_downloads,
+                                                         retry_count=retry_count)
 
         if len(failed_downloads) > 0 and (self._skip_failed is None or self._skip_failed is False):
             raise CellMapsImageDownloaderError('Failed to download: ' +
@@ -771,15 +1732,16 @@ class CellmapsImageDownloader(object):
         :param errors:
         :return:
         """
-        with open(self.get_image_gene_node_attributes_file(fold), 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=constants.IMAGE_GENE_NODE_COLS, delimiter='\t')
-            writer.writeheader()
-            for key in gene_node_attrs:
-                writer.writerow(gene_node_attrs[key])
+        cols = constants.IMAGE_GENE_NODE_COLS
+        with open(self.get_image_gene_node_attributes_file(fold), 'w', newline='',
+                  buffering=DOWNLOAD_BUFFER_SIZE) as f:
+            writer = csv.writer(f, delimiter='\t')
+            writer.writerow(cols)
+            writer.writerows([row.get(c, '') for c in cols]
+                             for row in gene_node_attrs.values())
         if errors is not None:
             with open(self.get_image_gene_node_errors_file(), 'w') as f:
-                for e in errors:
-                    f.write(str(e) + '\n')
+                f.writelines(f'{e}\n' for e in errors)
 
     def _add_imageurl_to_gene_node_attrs(self, gene_node_attrs=None):
         """
@@ -789,19 +1751,18 @@ class CellmapsImageDownloader(object):
         :type gene_node_attrs: dict
         """
         sample_urlmap = self._imageurlgen.get_sample_urlmap()
-        for key in gene_node_attrs:
-            sample = gene_node_attrs[key]
-            image_id = re.sub('^HPA0*|^CAB0*', '', sample['antibody']) + '/' + \
+        for sample in gene_node_attrs.values():
+            image_id = _ANTIBODY_PREFIX_RE.sub('', sample['antibody']) + '/' + \
                        sample['filename']
-            if image_id in sample_urlmap:
-                if sample_urlmap[image_id].startswith('http'):
-                    gene_node_attrs[key][constants.IMAGE_GENE_NODE_IMAGEURL_COL] = sample_urlmap[image_id]
-                else:
-                    gene_node_attrs[key][constants.IMAGE_GENE_NODE_IMAGEURL_COL] = 'no image url found'
-            else:
+            image_url = sample_urlmap.get(image_id)
+            if image_url is None:
                 # this should NOT happen, but just in case
                 logger.error(image_id + ' not in sample urlmap. setting to no image url found')
-                gene_node_attrs[key][constants.IMAGE_GENE_NODE_IMAGEURL_COL] = 'no image url found'
+                sample[constants.IMAGE_GENE_NODE_IMAGEURL_COL] = 'no image url found'
+            elif image_url.startswith('http'):
+                sample[constants.IMAGE_GENE_NODE_IMAGEURL_COL] = image_url
+            else:
+                sample[constants.IMAGE_GENE_NODE_IMAGEURL_COL] = 'no image url found'
 
     def generate_readme(self):
         description = getattr(cellmaps_imagedownloader, '__description__', 'No description provided.')
@@ -835,6 +1796,8 @@ class CellmapsImageDownloader(object):
             self._update_provenance_with_description()
             self._update_provenance_with_keywords()
             self._create_run_crate()
+            # FAIRSCAPE rewrites ro-crate-metadata.json for every registration
+            # without locking so registrations must not run concurrently
             self._register_samples_dataset()
             self._register_unique_dataset()
 
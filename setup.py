@@ -35,6 +35,11 @@ requirements = ['cellmaps_utils',
 
 setup_requirements = [ ]
 
+extras_requirements = {'async': ['aiohttp'],
+                       'iouring': ['liburing'],
+                       'orjson': ['orjson'],
+                       'isal': ['isal']}
+
 setup(
     author=author,
     author_email=email,
@@ -50,6 +55,7 @@ setup(
     ],
     description=desc,
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     long_description_content_type='text/x-rst',
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `cellmaps_imagedownloader` package."""
+
+import os
+import unittest
+import tempfile
+import shutil
+import threading
+import functools
+from unittest.mock import patch
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from cellmaps_imagedownloader import runner
+from cellmaps_imagedownloader.exceptions import CellMapsImageDownloaderError
+from cellmaps_imagedownloader.runner import AsyncImageDownloader
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipUnless(AsyncImageDownloader.is_available(), 'aiohttp not installed')
+class TestAsyncImageDownloader(unittest.TestCase):
+    """Tests for `cellmaps_imagedownloader` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self._temp_dir = tempfile.mkdtemp()
+        self._srcdir = os.path.join(self._temp_dir, 'src')
+        self._destdir = os.path.join(self._temp_dir, 'dest')
+        os.makedirs(self._srcdir)
+        os.makedirs(self._destdir)
+        handler = functools.partial(QuietHandler, directory=self._srcdir)
+        self._server = HTTPServer(('127.0.0.1', 0), handler)
+        self._url = 'http://127.0.0.1:' + str(self._server.server_port)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._temp_dir)
+
+    def test_download_images(self):
+        d_list = []
+        for x in range(10):
+            with open(os.path.join(self._srcdir, str(x) + '.jpg'), 'w') as f:
+                f.write('data' + str(x))
+            d_list.append((self._url + '/' + str(x) + '.jpg',
+                           os.path.join(self._destdir, str(x) + '.jpg')))
+        missing = (self._url + '/missing.jpg',
+                   os.path.join(self._destdir, 'missing.jpg'))
+        d_list.append(missing)
+
+        dloader = AsyncImageDownloader(poolsize=4)
+        failed = dloader.download_images(download_list=d_list)
+        self.assertEqual(1, len(failed))
+        self.assertEqual(404, failed[0][0])
+        self.assertEqual(missing, failed[0][2])
+        self.assertFalse(os.path.isfile(missing[1]))
+        for x in range(10):
+            with open(os.path.join(self._destdir, str(x) + '.jpg'), 'r') as f:
+                self.assertEqual('data' + str(x), f.read())
+
+    def test_download_images_generator(self):
+        for x in range(10):
+            with open(os.path.join(self._srcdir, str(x) + '.jpg'), 'w') as f:
+                f.write('data' + str(x))
+        d_gen = ((self._url + '/' + str(x) + '.jpg',
+                  os.path.join(self._destdir, str(x) + '.jpg')) for x in range(10))
+        dloader = AsyncImageDownloader(poolsize=3)
+        self.assertEqual([], dloader.download_images(download_list=d_gen,
+                                                     total=10))
+        for x in range(10):
+            with open(os.path.join(self._destdir, str(x) + '.jpg'), 'r') as f:
+                self.assertEqual('data' + str(x), f.read())
+
+    def test_download_images_skip_existing(self):
+        dest_file = os.path.join(self._destdir, 'a.jpg')
+        with open(dest_file, 'w') as f:
+            f.write('blah')
+        dloader = AsyncImageDownloader(poolsize=4, skip_existing=True)
+        failed = dloader.download_images(download_list=[(self._url + '/a.jpg',
+                                                         dest_file)])
+        self.assertEqual([], failed)
+        with open(dest_file, 'r') as f:
+            self.assertEqual('blah', f.read())
+
+    def test_download_images_empty_body(self):
+        open(os.path.join(self._srcdir, 'empty.jpg'), 'w').close()
+        dest_file = os.path.join(self._destdir, 'empty.jpg')
+        dloader = AsyncImageDownloader(poolsize=4)
+        failed = dloader.download_images(download_list=[(self._url + '/empty.jpg',
+                                                         dest_file)])
+        self.assertEqual(1, len(failed))
+        self.assertEqual(204, failed[0][0])
+        self.assertFalse(os.path.isfile(dest_file))
+
+    def test_download_images_connection_error(self):
+        dest_file = os.path.join(self._destdir, 'a.jpg')
+        dloader = AsyncImageDownloader(poolsize=4)
+        failed = dloader.download_images(download_list=[('http://127.0.0.1:1/a.jpg',
+                                                         dest_file)])
+        self.assertEqual(1, len(failed))
+        self.assertEqual(-2, failed[0][0])
+
+
+class TestAsyncImageDownloaderNoAiohttp(unittest.TestCase):
+
+    def test_constructor_without_aiohttp(self):
+        with patch.object(runner, 'aiohttp', None):
+            self.assertFalse(AsyncImageDownloader.is_available())
+            try:
+                AsyncImageDownloader()
+                self.fail('Expected Exception')
+            except CellMapsImageDownloaderError as ce:
+                self.assertEqual('aiohttp package is required for '
+                                 'AsyncImageDownloader', str(ce))
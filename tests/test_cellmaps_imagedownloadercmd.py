@@ -28,11 +28,14 @@ class TestCellmapsDownloader(unittest.TestCase):
 
         self.assertEqual(res.verbose, 1)
         self.assertEqual(res.logconf, None)
+        self.assertIsNone(res.genequery_cachedir)
+        self.assertFalse(res.use_iouring)
 
         someargs = ['foo', '-vv', '--logconf',
-                    'hi']
+                    'hi', '--use_iouring']
         res = cellmaps_imagedownloadercmd._parse_arguments('hi',
                                                            someargs)
+        self.assertTrue(res.use_iouring)
 
         self.assertEqual(res.verbose, 3)
         self.assertEqual(res.outdir, 'foo')
@@ -10,12 +10,14 @@ import shutil
 import requests
 import requests_mock
 from unittest.mock import MagicMock
+from unittest.mock import patch
 import json
 from cellmaps_utils import constants
 import cellmaps_imagedownloader
 from cellmaps_imagedownloader.exceptions import CellMapsImageDownloaderError
 from cellmaps_imagedownloader.gene import ImageGeneNodeAttributeGenerator
 from cellmaps_imagedownloader.runner import CellmapsImageDownloader
+from cellmaps_imagedownloader.provenance import InProcessProvenanceUtil
 from cellmaps_imagedownloader import runner
 
 
@@ -33,6 +35,14 @@ class TestCellmapsdownloaderrunner(unittest.TestCase):
         myobj = CellmapsImageDownloader(outdir='foo')
         self.assertIsNotNone(myobj)
 
+    def test_constructor_default_provenance_utils_not_shared(self):
+        first = CellmapsImageDownloader(outdir='foo')
+        second = CellmapsImageDownloader(outdir='foo')
+        self.assertIsInstance(first._provenance_utils,
+                              InProcessProvenanceUtil)
+        self.assertIsNot(first._provenance_utils,
+                         second._provenance_utils)
+
     def test_constructor_no_outdir(self):
         try:
             CellmapsImageDownloader()
@@ -343,6 +353,33 @@ class TestCellmapsdownloaderrunner(unittest.TestCase):
         self.assertEqual(False,
                          myobj._add_dataset_to_crate.call_args_list[0][1]['skip_copy'])
 
+    def test_register_samples_dataset_hardlinks_input(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            run_dir = os.path.join(temp_dir, 'run')
+            os.makedirs(run_dir)
+            samples_file = os.path.join(temp_dir, 'mysamples.csv')
+            with open(samples_file, 'w') as f:
+                f.write('filename\n')
+            prov_dict = {CellmapsImageDownloader.SAMPLES_FILEKEY: {'name': 'x'}}
+
+            myobj = CellmapsImageDownloader(outdir=run_dir,
+                                            provenance=prov_dict,
+                                            input_data_dict={CellmapsImageDownloader.SAMPLES_FILEKEY: samples_file})
+            myobj._add_dataset_to_crate = MagicMock()
+            myobj._add_dataset_to_crate.side_effect = ['id1']
+            myobj._register_samples_dataset()
+            self.assertEqual('id1', myobj._samples_datasetid)
+
+            linked_file = os.path.join(run_dir, 'mysamples.csv')
+            self.assertTrue(os.path.samefile(samples_file, linked_file))
+            self.assertEqual(linked_file,
+                             myobj._add_dataset_to_crate.call_args_list[0][1]['source_file'])
+            self.assertEqual(True,
+                             myobj._add_dataset_to_crate.call_args_list[0][1]['skip_copy'])
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_register_unique_dataset(self):
         prov_dict = {CellmapsImageDownloader.UNIQUE_FILEKEY: {'name': 'x'}}
 
@@ -415,6 +452,109 @@ class TestCellmapsdownloaderrunner(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_download_file_larger_then_buffer(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            mockurl = 'http://fakey.fake.com/ha.txt'
+            somedata = 'abcdefghij' * (runner.DOWNLOAD_BUFFER_SIZE // 4)
+            with requests_mock.mock() as m:
+                m.get(mockurl, status_code=200,
+                      text=somedata)
+                a_dest_file = os.path.join(temp_dir, 'downloadedfile.txt')
+                self.assertIsNone(runner.download_file((mockurl, a_dest_file)))
+            with open(a_dest_file, 'r') as f:
+                self.assertEqual(somedata, f.read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_bytes_to_file_preallocate_fails(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            a_dest_file = os.path.join(temp_dir, 'somefile.txt')
+            with patch('cellmaps_imagedownloader.runner.os.posix_fallocate',
+                       side_effect=OSError('not supported'),
+                       create=True) as mock_fallocate:
+                with patch.object(runner, 'PREALLOCATE_MIN_SIZE', 1):
+                    runner._write_bytes_to_file(b'somedata', a_dest_file)
+            mock_fallocate.assert_called_once()
+            with open(a_dest_file, 'rb') as f:
+                self.assertEqual(b'somedata', f.read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_bytes_to_file_noatime_not_permitted(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            a_dest_file = os.path.join(temp_dir, 'somefile.txt')
+            real_open = os.open
+            flags_used = []
+
+            def fake_open(path, flags, mode=0o777):
+                flags_used.append(flags)
+                if len(flags_used) == 1:
+                    raise PermissionError('Operation not permitted')
+                return real_open(path, flags, mode)
+
+            with patch.object(runner.os, 'O_NOATIME', 0o1000000, create=True):
+                with patch.object(runner, '_WRITE_FLAGS',
+                                  runner._WRITE_FLAGS | 0o1000000):
+                    with patch('cellmaps_imagedownloader.runner.os.open',
+                               side_effect=fake_open):
+                        runner._write_bytes_to_file(b'somedata', a_dest_file)
+            self.assertEqual(2, len(flags_used))
+            self.assertTrue(flags_used[0] & 0o1000000)
+            self.assertFalse(flags_used[1] & 0o1000000)
+            with open(a_dest_file, 'rb') as f:
+                self.assertEqual(b'somedata', f.read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_bytes_to_file_small_file_not_preallocated(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            a_dest_file = os.path.join(temp_dir, 'somefile.txt')
+            with patch('cellmaps_imagedownloader.runner.os.posix_fallocate',
+                       create=True) as mock_fallocate:
+                runner._write_bytes_to_file(b'somedata', a_dest_file)
+            mock_fallocate.assert_not_called()
+            with open(a_dest_file, 'rb') as f:
+                self.assertEqual(b'somedata', f.read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_session(self):
+        session = runner._get_session()
+        self.assertIs(session, runner._get_session())
+        retry = session.get_adapter('https://images.proteinatlas.org').max_retries
+        self.assertEqual(runner.MAX_HTTP_RETRIES, retry.total)
+        self.assertEqual(runner.RETRY_BACKOFF_FACTOR, retry.backoff_factor)
+        # error responses are retried by _download_images only
+        self.assertFalse(retry.status_forcelist)
+        self.assertFalse(retry.respect_retry_after_header)
+        self.assertFalse(retry.is_retry('GET', 503, has_retry_after=True))
+        self.assertFalse(retry.is_retry('GET', 429, has_retry_after=True))
+        self.assertFalse(retry.raise_on_status)
+
+    def test_get_session_larger_pool(self):
+        session = runner._get_session()
+        old_adapter = session.get_adapter('https://a.b')
+        old_adapter.poolmanager.connection_from_url('https://a.b')
+        self.assertEqual(1, len(old_adapter.poolmanager.pools))
+        pool_maxsize = runner._SESSION_POOL_MAXSIZE + 1
+        self.assertIs(session, runner._get_session(pool_maxsize=pool_maxsize))
+        self.assertEqual(pool_maxsize, runner._SESSION_POOL_MAXSIZE)
+        adapter = session.get_adapter('https://a.b')
+        self.assertIsNot(old_adapter, adapter)
+        # replaced adapter is closed releasing its pools
+        self.assertEqual(0, len(old_adapter.poolmanager.pools))
+        self.assertIs(adapter, session.get_adapter('http://a.b'))
+        self.assertEqual(runner.MAX_HTTP_RETRIES, adapter.max_retries.total)
+        # smaller request keeps larger pool
+        runner._get_session(pool_maxsize=1)
+        self.assertEqual(pool_maxsize, runner._SESSION_POOL_MAXSIZE)
+        self.assertIs(adapter, session.get_adapter('https://a.b'))
+
     def test_download_file_failure(self):
         temp_dir = tempfile.mkdtemp()
 
@@ -434,6 +574,23 @@ class TestCellmapsdownloaderrunner(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_download_file_empty_body(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            mockurl = 'http://fakey.fake.com/ha.txt'
+
+            with requests_mock.mock() as m:
+                m.get(mockurl, status_code=200, text='')
+                a_dest_file = os.path.join(temp_dir, 'downloadedfile.txt')
+                rstatus, rtext, rtuple = runner.download_file((mockurl, a_dest_file))
+            self.assertEqual(204, rstatus)
+            self.assertEqual('empty body', rtext)
+            self.assertEqual((mockurl, a_dest_file), rtuple)
+            self.assertFalse(os.path.isfile(a_dest_file))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_download_raise_httperror(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -572,6 +729,14 @@ class TestCellmapsdownloaderrunner(unittest.TestCase):
             crunner._create_output_directory()
             for c in constants.COLORS:
                 self.assertTrue(os.path.isdir(os.path.join(run_dir, c)))
+
+            # color directories that already exist are fine
+            os.rmdir(os.path.join(run_dir, constants.COLORS[0]))
+            crunner = CellmapsImageDownloader(outdir=run_dir,
+                                              existing_outdir=True)
+            crunner._create_output_directory()
+            for c in constants.COLORS:
+                self.assertTrue(os.path.isdir(os.path.join(run_dir, c)))
         finally:
             shutil.rmtree(temp_dir)
 
@@ -608,10 +773,11 @@ class TestCellmapsdownloaderrunner(unittest.TestCase):
             self.assertEqual(4, len(res))
             for c in constants.COLORS:
                 self.assertTrue(os.path.join(run_dir, c) in res[c])
+            self.assertIs(res, crunner._get_color_download_map())
         finally:
             shutil.rmtree(temp_dir)
 
-    def test_get_download_tuples(self):
+    def test_iter_download_tuples(self):
         temp_dir = tempfile.mkdtemp()
         try:
             imageurlgen = MagicMock()
@@ -627,10 +793,118 @@ class TestCellmapsdownloaderrunner(unittest.TestCase):
             run_dir = os.path.abspath(os.path.join(temp_dir, 'run'))
             crunner = CellmapsImageDownloader(outdir=run_dir,
                                               imageurlgen=imageurlgen)
-            res = crunner._get_download_tuples()
+            res = list(crunner._iter_download_tuples())
             self.assertEqual(2, len(res))
 
             self.assertTrue(('url1', '/url1') in res)
             self.assertTrue(('url2', '/url2') in res)
         finally:
             shutil.rmtree(temp_dir)
+
+    def test_write_image_gene_node_attrs(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            crunner = CellmapsImageDownloader(outdir=temp_dir)
+            gene_node_attrs = {'x': {'name': 'A', 'represents': 'ensembl:1',
+                                     'ambiguous': '', 'antibody': 'HPA1',
+                                     'filename': '1_A1_1_',
+                                     'imageurl': 'http://a'},
+                               'y': {'name': 'B', 'represents': 'ensembl:2',
+                                     'ambiguous': 'C', 'antibody': 'HPA2',
+                                     'filename': '2_A1_1_'}}
+            crunner._write_image_gene_node_attrs(gene_node_attrs=gene_node_attrs,
+                                                 errors=['err1'])
+            with open(crunner.get_image_gene_node_attributes_file(1), 'r') as f:
+                lines = f.read().splitlines()
+            self.assertEqual(['\t'.join(constants.IMAGE_GENE_NODE_COLS),
+                              'A\tensembl:1\t\tHPA1\t1_A1_1_\thttp://a',
+                              'B\tensembl:2\tC\tHPA2\t2_A1_1_\t'], lines)
+            with open(crunner.get_image_gene_node_errors_file(), 'r') as f:
+                self.assertEqual('err1\n', f.read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_is_retryable(self):
+        for code in [-5, -1, 408, 429, 500, 503]:
+            self.assertTrue(CellmapsImageDownloader._is_retryable(code))
+        for code in [400, 403, 404]:
+            self.assertFalse(CellmapsImageDownloader._is_retryable(code))
+
+    def test_retry_failed_images(self):
+        dloader = MagicMock()
+        dloader.download_images = MagicMock(return_value=[])
+        crunner = CellmapsImageDownloader(outdir='/foo',
+                                          imagedownloader=dloader)
+        failed = [(404, 'not found', ('url1', '/url1')),
+                  (-2, 'connection', ('url2', '/url2')),
+                  (408, 'timeout', ('url3', '/url3'))]
+        with patch('cellmaps_imagedownloader.runner.time.sleep') as mock_sleep:
+            res = crunner._retry_failed_images(failed_downloads=failed)
+            mock_sleep.assert_not_called()
+        self.assertEqual([failed[0]], res)
+        dloader.download_images.assert_called_once_with([('url2', '/url2'),
+                                                         ('url3', '/url3')])
+
+    def test_retry_failed_images_rate_limited_waits(self):
+        dloader = MagicMock()
+        dloader.download_images = MagicMock(return_value=[])
+        crunner = CellmapsImageDownloader(outdir='/foo',
+                                          imagedownloader=dloader)
+        failed = [(429, 'too many', ('url1', '/url1'))]
+        with patch('cellmaps_imagedownloader.runner.time.sleep') as mock_sleep:
+            self.assertEqual([], crunner._retry_failed_images(failed_downloads=failed,
+                                                              retry_count=3))
+            mock_sleep.assert_called_once_with(8)
+            crunner._retry_failed_images(failed_downloads=failed, retry_count=10)
+            mock_sleep.assert_called_with(CellmapsImageDownloader.MAX_RETRY_WAIT)
+
+    def test_retry_failed_images_grouped_by_host(self):
+        dloader = MagicMock()
+        dloader.download_images = MagicMock(return_value=[])
+        crunner = CellmapsImageDownloader(outdir='/foo',
+                                          imagedownloader=dloader)
+        failed = [(-2, 'connection', ('http://a/1.jpg', '/1')),
+                  (-2, 'connection', ('http://b/2.jpg', '/2')),
+                  (-2, 'connection', ('http://a/3.jpg', '/3'))]
+        with patch('cellmaps_imagedownloader.runner.time.sleep') as mock_sleep:
+            crunner._retry_failed_images(failed_downloads=failed)
+            mock_sleep.assert_not_called()
+        dloader.download_images.assert_called_once_with([('http://a/1.jpg', '/1'),
+                                                         ('http://a/3.jpg', '/3'),
+                                                         ('http://b/2.jpg', '/2')])
+
+    def test_download_images_no_retry_of_permanent_failures(self):
+        dloader = MagicMock()
+        failed = [(404, 'not found', ('url1', '/url1'))]
+        dloader.download_images = MagicMock(return_value=failed)
+        crunner = CellmapsImageDownloader(outdir='/foo',
+                                          imagedownloader=dloader,
+                                          skip_failed=True)
+        crunner._iter_download_tuples = MagicMock(return_value=iter([('url1', '/url1')]))
+        self.assertEqual((0, failed), crunner._download_images())
+        dloader.download_images.assert_called_once()
+
+    def test_add_imageurl_to_gene_node_attrs(self):
+        imageurlgen = MagicMock()
+        imageurlgen.get_sample_urlmap = MagicMock(return_value={'1/1_A1_1_': 'http://a/1_A1_1_blue.jpg',
+                                                                '2/2_A1_1_': '/local/2_A1_1_blue.jpg'})
+        crunner = CellmapsImageDownloader(outdir='/foo',
+                                          imageurlgen=imageurlgen)
+        gene_node_attrs = {'x': {'antibody': 'HPA001', 'filename': '1_A1_1_'},
+                           'y': {'antibody': 'CAB002', 'filename': '2_A1_1_'},
+                           'z': {'antibody': 'HPA003', 'filename': '3_A1_1_'}}
+        crunner._add_imageurl_to_gene_node_attrs(gene_node_attrs=gene_node_attrs)
+        self.assertEqual('http://a/1_A1_1_blue.jpg',
+                         gene_node_attrs['x'][constants.IMAGE_GENE_NODE_IMAGEURL_COL])
+        self.assertEqual('no image url found',
+                         gene_node_attrs['y'][constants.IMAGE_GENE_NODE_IMAGEURL_COL])
+        self.assertEqual('no image url found',
+                         gene_node_attrs['z'][constants.IMAGE_GENE_NODE_IMAGEURL_COL])
+
+    def test_get_num_download_tuples(self):
+        crunner = CellmapsImageDownloader(outdir='/foo')
+        self.assertIsNone(crunner._get_num_download_tuples())
+        imagegen = MagicMock()
+        imagegen.get_samples_list = MagicMock(return_value=[{}, {}])
+        crunner = CellmapsImageDownloader(outdir='/foo', imagegen=imagegen)
+        self.assertEqual(8, crunner._get_num_download_tuples())
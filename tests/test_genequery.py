@@ -9,6 +9,8 @@ import tempfile
 import shutil
 import json
 from unittest.mock import MagicMock
+from unittest.mock import patch
+from cellmaps_imagedownloader import gene
 from cellmaps_imagedownloader.gene import GeneQuery
 
 SKIP_REASON = 'CELLMAPS_IMAGEDOWNLOADER_INTEGRATION_TEST ' \
@@ -49,6 +51,94 @@ class TestGeneQuery(unittest.TestCase):
                                                     fields=['ensembl.gene', 'symbol'],
                                                     species='human')
 
+    def test_get_symbols_for_genes_in_chunks(self):
+        mockquery = MagicMock()
+        mockquery.querymany = MagicMock(side_effect=lambda genes, **kwargs:
+                                        [{'query': g} for g in genes])
+        query = GeneQuery(mygeneinfo=mockquery)
+        genelist = ['g' + str(x) for x in range(GeneQuery.QUERY_CHUNK_SIZE * 2 + 1)]
+        res = query.get_symbols_for_genes(genelist=list(genelist))
+        self.assertEqual(genelist, [x['query'] for x in res])
+        self.assertEqual(3, mockquery.querymany.call_count)
+        for call in mockquery.querymany.call_args_list:
+            self.assertTrue(len(call[0][0]) <= GeneQuery.QUERY_CHUNK_SIZE)
+            self.assertEqual('_id', call[1]['scopes'])
+            self.assertEqual('human', call[1]['species'])
+
+    def test_get_symbols_for_genes_cached(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache_dir = os.path.join(temp_dir, 'cache')
+            mockquery = MagicMock()
+            res = [{'query': 'g1', 'symbol': 'S1'},
+                   {'query': 'g2', 'symbol': 'S2'}]
+            mockquery.querymany = MagicMock(return_value=res)
+            query = GeneQuery(mygeneinfo=mockquery, cache_dir=cache_dir)
+            self.assertEqual(res, query.get_symbols_for_genes(genelist=['g1', 'g2']))
+            self.assertEqual(1, len(os.listdir(cache_dir)))
+
+            # order of genes does not matter and mygene is not queried again
+            query = GeneQuery(mygeneinfo=mockquery, cache_dir=cache_dir)
+            self.assertEqual(res, query.get_symbols_for_genes(genelist=['g2', 'g1']))
+            mockquery.querymany.assert_called_once()
+
+            # different scope is a different query
+            query.get_symbols_for_genes(genelist=['g1', 'g2'],
+                                        scopes='ensembl.gene')
+            self.assertEqual(2, mockquery.querymany.call_count)
+            self.assertEqual(2, len(os.listdir(cache_dir)))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_symbols_for_genes_cached_without_orjson(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            mockquery = MagicMock()
+            res = [{'query': 'g1', 'symbol': 'S1'}]
+            mockquery.querymany = MagicMock(return_value=res)
+            with patch.object(gene, 'orjson', None):
+                query = GeneQuery(mygeneinfo=mockquery, cache_dir=temp_dir)
+                self.assertEqual(res, query.get_symbols_for_genes(genelist=['g1']))
+                self.assertEqual(res, query.get_symbols_for_genes(genelist=['g1']))
+            mockquery.querymany.assert_called_once()
+            cache_file = os.path.join(temp_dir, os.listdir(temp_dir)[0])
+            with open(cache_file, 'r') as f:
+                self.assertEqual(res, json.load(f))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_symbols_for_genes_corrupt_cache_file(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            mockquery = MagicMock()
+            res = [{'query': 'g1', 'symbol': 'S1'}]
+            mockquery.querymany = MagicMock(return_value=res)
+            query = GeneQuery(mygeneinfo=mockquery, cache_dir=temp_dir)
+            self.assertEqual(res, query.get_symbols_for_genes(genelist=['g1']))
+            cache_file = os.path.join(temp_dir, os.listdir(temp_dir)[0])
+            with open(cache_file, 'w') as f:
+                f.write('[{"query": "g1", "sym')
+
+            # falls back to mygene and rewrites cache file
+            self.assertEqual(res, query.get_symbols_for_genes(genelist=['g1']))
+            self.assertEqual(2, mockquery.querymany.call_count)
+            with open(cache_file, 'r') as f:
+                self.assertEqual(res, json.load(f))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_symbols_for_genes_cache_not_writable(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache_dir = os.path.join(temp_dir, 'afile')
+            open(cache_dir, 'w').close()
+            mockquery = MagicMock()
+            mockquery.querymany = MagicMock(return_value=[])
+            query = GeneQuery(mygeneinfo=mockquery, cache_dir=cache_dir)
+            self.assertEqual([], query.get_symbols_for_genes(genelist=['g1']))
+        finally:
+            shutil.rmtree(temp_dir)
+
     @unittest.skipUnless(os.getenv('CELLMAPS_DOWNLOADER_INTEGRATION_TEST') is not None, SKIP_REASON)
     def test_simple_query(self):
         query = GeneQuery()
@@ -48,6 +48,19 @@ class TestImageGeneNodeAttributeGenerator(unittest.TestCase):
 
         self.assertEqual([{'antibody': 'HPA123'}], gen.get_samples_list())
 
+    def test_filter_samples_by_unique_list_keeps_order_and_list(self):
+        samples = [{'antibody': 'HPA123', 'sample': 1},
+                   {'antibody': 'xxx', 'sample': 2},
+                   {'antibody': 'CAB456', 'sample': 3},
+                   {'antibody': 'xxx', 'sample': 4},
+                   {'antibody': 'HPA123', 'sample': 5}]
+        gen = ImageGeneNodeAttributeGenerator(samples_list=samples,
+                                              unique_list=[{'antibody': 'HPA123'},
+                                                           {'antibody': 'CAB456'}])
+        gen._filter_samples_by_unique_list()
+        self.assertIs(samples, gen.get_samples_list())
+        self.assertEqual([1, 3, 5], [x['sample'] for x in samples])
+
     def test_get_image_id_for_sample_none(self):
         try:
             ImageGeneNodeAttributeGenerator.get_image_id_for_sample(None)
@@ -363,7 +376,11 @@ class TestImageGeneNodeAttributeGenerator(unittest.TestCase):
         # check errors is empty
         self.assertEqual([], res[1])
 
-    def test_get_gene_node_attributes_no_symbol(self):
+    def _get_single_sample_imagegen(self, query_res):
+        """
+        Gets generator for one sample of antibody HPA000992 with
+        ensembl id ENSG1 whose genequery returns **query_res**
+        """
         samples = [{'if_plate_id': '1',
                     'position': 'A1',
                     'sample': '1',
@@ -375,15 +392,18 @@ class TestImageGeneNodeAttributeGenerator(unittest.TestCase):
                    'gene_names': 'XXX'}]
 
         mockgenequery = MagicMock()
-        mockgenequery.get_symbols_for_genes = MagicMock(return_value=[{'query': 'ENSG1',
-                                                                       '_id': '9950',
-                                                                       '_score': 25.046944,
-                                                                       'ensembl': {'gene':'ENSG1'},
-                                                                       }])
+        mockgenequery.get_symbols_for_genes = MagicMock(return_value=query_res)
 
-        imagegen = ImageGeneNodeAttributeGenerator(samples_list=samples,
-                                                   unique_list=unique,
-                                                   genequery=mockgenequery)
+        return ImageGeneNodeAttributeGenerator(samples_list=samples,
+                                               unique_list=unique,
+                                               genequery=mockgenequery)
+
+    def test_get_gene_node_attributes_no_symbol(self):
+        imagegen = self._get_single_sample_imagegen([{'query': 'ENSG1',
+                                                      '_id': '9950',
+                                                      '_score': 25.046944,
+                                                      'ensembl': {'gene': 'ENSG1'},
+                                                      }])
 
         res = imagegen.get_gene_node_attributes()
         gene_node_attrs = res[0]
@@ -391,61 +411,30 @@ class TestImageGeneNodeAttributeGenerator(unittest.TestCase):
         self.assertTrue('ENSG1' in gene_node_attrs)
         self.assertEqual('ENSG1', gene_node_attrs['ENSG1']['name'])
         self.assertEqual('ENSG1', gene_node_attrs['ENSG1']['represents'])
-        self.assertTrue(gene_node_attrs['ENSG1']['filename'] == '1_A1_2_' or
-                        gene_node_attrs['ENSG1']['filename'] == '1_A1_1_')
+        self.assertEqual('1_A1_1_', gene_node_attrs['ENSG1']['filename'])
 
-    def test_get_gene_node_attributes_no_ensembl(self):
-        samples = [{'if_plate_id': '1',
-                    'position': 'A1',
-                    'sample': '1',
-                    'antibody': 'HPA000992',
-                    'ensembl_ids': 'ENSG1',
-                    'gene_names': 'XXX'}]
-        unique = [{'antibody': 'HPA000992',
-                   'ensembl_ids': 'ENSG1',
-                   'gene_names': 'XXX'}]
-
-        mockgenequery = MagicMock()
-        mockgenequery.get_symbols_for_genes = MagicMock(return_value=[{'query': 'ENSG1',
-                                                                       'notfound': True,
-                                                                       }])
-
-        imagegen = ImageGeneNodeAttributeGenerator(samples_list=samples,
-                                                   unique_list=unique,
-                                                   genequery=mockgenequery)
+    def test_get_gene_node_attributes_notfound(self):
+        imagegen = self._get_single_sample_imagegen([{'query': 'ENSG1',
+                                                      'notfound': True,
+                                                      }])
 
         res = imagegen.get_gene_node_attributes()
         self.assertEqual({}, res[0])
 
         # check we got an error
-        self.assertTrue(1, len(res[1]))
+        self.assertEqual(1, len(res[1]))
         self.assertTrue('no ensembl in query result' in res[1][0])
 
     def test_get_gene_node_attributes_no_ensembl(self):
-        samples = [{'if_plate_id': '1',
-                    'position': 'A1',
-                    'sample': '1',
-                    'antibody': 'HPA000992',
-                    'ensembl_ids': 'ENSG1',
-                    'gene_names': 'XXX'}]
-        unique = [{'antibody': 'HPA000992',
-                   'ensembl_ids': 'ENSG1',
-                   'gene_names': 'XXX'}]
-
-        mockgenequery = MagicMock()
-        mockgenequery.get_symbols_for_genes = MagicMock(return_value=[{'query': 'ENSG1',
-                                                                       'symbol': 'XXX',
-                                                                       }])
-
-        imagegen = ImageGeneNodeAttributeGenerator(samples_list=samples,
-                                                   unique_list=unique,
-                                                   genequery=mockgenequery)
+        imagegen = self._get_single_sample_imagegen([{'query': 'ENSG1',
+                                                      'symbol': 'XXX',
+                                                      }])
 
         res = imagegen.get_gene_node_attributes()
         self.assertEqual({}, res[0])
 
         # check we got an error
-        self.assertTrue(1, len(res[1]))
+        self.assertEqual(1, len(res[1]))
         self.assertTrue('no ensembl in query result' in res[1][0])
 
     def test_get_gene_node_attributes_multiple_ensembl(self):
@@ -477,6 +466,16 @@ class TestImageGeneNodeAttributeGenerator(unittest.TestCase):
         # check we got no error
         self.assertEqual(0, len(res[1]))
 
+    def test_process_query_results_ensembl_formats(self):
+        imagegen = ImageGeneNodeAttributeGenerator(genequery=MagicMock())
+        query_res = [{'query': 'ENSG1', 'symbol': 'geneA',
+                      'ensembl': [{'gene': 'ENSG1'}]},
+                     {'query': 'ENSG2', 'symbol': 'geneB',
+                      'ensembl': {'gene': 'ENSG2', 'transcript': ['ENST2']}}]
+        res = imagegen._process_query_results(query_res)
+        self.assertEqual({'geneA': {'ENSG1'}, 'geneB': {'ENSG2'}}, res[2])
+        self.assertEqual([], res[3])
+
     def test_write_samples_to_csvfile_with_no_file(self):
         mockgenequery = MagicMock()
         imagegen = ImageGeneNodeAttributeGenerator(genequery=mockgenequery)
@@ -507,6 +506,83 @@ class TestImageGeneNodeAttributeGenerator(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_write_samples_to_csvfile_with_linkprefix(self):
+        mockgenequery = MagicMock()
+        temp_dir = tempfile.mkdtemp()
+        try:
+            csvfile = os.path.join(temp_dir, 'foo.csv')
+            sample = {'filename': '/archive/1/1_A1_1_',
+                      'if_plate_id': '1', 'position': 'A1',
+                      'sample': '1',
+                      'locations': 'Golgi apparatus',
+                      'antibody': 'HPA000992',
+                      'ensembl_ids': 'ENSG00000066455',
+                      'gene_names': 'GOLGA5'}
+            samples = [dict(sample, linkprefix='http://foo/1_A1_1_')]
+            imagegen = ImageGeneNodeAttributeGenerator(genequery=mockgenequery,
+                                                       samples_list=samples)
+            imagegen.write_samples_to_csvfile(csvfile)
+
+            res = ImageGeneNodeAttributeGenerator.get_samples_from_csvfile(csvfile)
+            self.assertEqual([sample], res)
+            # samples passed in are not modified
+            self.assertEqual('http://foo/1_A1_1_', samples[0]['linkprefix'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_samples_from_csvfile_linkprefix_and_short_row(self):
+        csv_data = 'filename,if_plate_id,position,sample,' \
+                   'locations,antibody,ensembl_ids,gene_names,linkprefix\n' \
+                   '\n' \
+                   '/archive/1/1_A1_1_,1,A1,1,Golgi apparatus,HPA000992,' \
+                   'ENSG00000066455,GOLGA5,http://foo/1_A1_1_\n' \
+                   '/archive/1/1_A1_2_,1,A1,2,Golgi apparatus,HPA000992\n'
+        with patch('builtins.open', mock_open(read_data=csv_data)):
+            result = ImageGeneNodeAttributeGenerator.get_samples_from_csvfile('test.csv')
+        self.assertEqual(2, len(result))
+        self.assertEqual('http://foo/1_A1_1_', result[0]['linkprefix'])
+        self.assertEqual('GOLGA5', result[0]['gene_names'])
+        self.assertEqual('HPA000992', result[1]['antibody'])
+        self.assertIsNone(result[1]['ensembl_ids'])
+        self.assertIsNone(result[1]['linkprefix'])
+        # repeated values are interned so rows share one string
+        self.assertIs(result[0]['antibody'], result[1]['antibody'])
+        self.assertIs(result[0]['locations'], result[1]['locations'])
+
+    def test_iter_samples_from_csvfile_none(self):
+        try:
+            ImageGeneNodeAttributeGenerator.iter_samples_from_csvfile(None)
+            self.fail('Expected exception')
+        except CellMapsImageDownloaderError as ce:
+            self.assertEqual('csvfile is None', str(ce))
+
+    def test_get_dicts_of_gene_to_antibody_filename_from_iter_samples(self):
+        csv_data = 'filename,if_plate_id,position,sample,' \
+                   'locations,antibody,ensembl_ids,gene_names\n' \
+                   '/archive/1/1_A1_1_,1,A1,1,Golgi apparatus,HPA000992,' \
+                   'ENSG00000066455,GOLGA5\n' \
+                   '/archive/1/1_A1_2_,1,A1,2,Golgi apparatus,HPA000992,' \
+                   'ENSG00000066455,GOLGA5\n' \
+                   '/archive/2/2_B1_1_,2,B1,1,Nucleus,CAB000001,' \
+                   '"ENSG1,ENSG2","A,B"\n'
+        with patch('builtins.open', mock_open(read_data=csv_data)):
+            samples = ImageGeneNodeAttributeGenerator.iter_samples_from_csvfile('test.csv')
+            self.assertFalse(isinstance(samples, list))
+            imagegen = ImageGeneNodeAttributeGenerator()
+            antibody_dict, filename_dict, ambig_dict = \
+                imagegen.get_dicts_of_gene_to_antibody_filename(samples=samples)
+        self.assertEqual({'ENSG00000066455': 'HPA000992',
+                          'ENSG1': 'CAB000001',
+                          'ENSG2': 'CAB000001'}, antibody_dict)
+        self.assertEqual({'HPA000992': {'1_A1_1_', '1_A1_2_'},
+                          'CAB000001': {'2_B1_1_'}}, filename_dict)
+        self.assertEqual({'CAB000001': ['ENSG1', 'ENSG2']}, ambig_dict)
+
+    def test_get_unique_list_from_csvfile_missing_column(self):
+        with patch('builtins.open', mock_open(read_data='antibody\nABC\n')):
+            with self.assertRaises(KeyError):
+                ImageGeneNodeAttributeGenerator.get_unique_list_from_csvfile('test.csv')
+
     def test_write_unique_list_to_csvfile_with_no_file(self):
         mockgenequery = MagicMock()
         imagegen = ImageGeneNodeAttributeGenerator(genequery=mockgenequery)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `cellmaps_imagedownloader` package."""
+
+import os
+import json
+import unittest
+import tempfile
+import shutil
+from unittest.mock import patch
+from cellmaps_imagedownloader import provenance
+from cellmaps_imagedownloader.provenance import InProcessProvenanceUtil
+
+
+@unittest.skipIf(provenance.fairscape_cli is None, 'fairscape-cli not installed')
+class TestInProcessProvenanceUtil(unittest.TestCase):
+    """Tests for `cellmaps_imagedownloader` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self._temp_dir)
+
+    def test_register_rocrate_and_dataset(self):
+        prov = InProcessProvenanceUtil()
+        prov.register_rocrate(self._temp_dir, name='name',
+                              organization_name='org',
+                              project_name='project',
+                              description='some description',
+                              keywords=['a'])
+        self.assertTrue(os.path.isfile(os.path.join(self._temp_dir,
+                                                    'ro-crate-metadata.json')))
+        data_file = os.path.join(self._temp_dir, 'data.csv')
+        with open(data_file, 'w') as f:
+            f.write('a\n')
+        data_dict = {'name': 'data', 'author': 'author', 'version': '1',
+                     'date-published': '2024-01-01',
+                     'description': 'data description',
+                     'data-format': 'csv', 'keywords': ['a']}
+        dataset_id = prov.register_dataset(self._temp_dir, data_dict=data_dict,
+                                           source_file=data_file,
+                                           skip_copy=True)
+        self.assertTrue(dataset_id.startswith('ark:'))
+
+    def test_register_multiple_datasets(self):
+        prov = InProcessProvenanceUtil()
+        prov.register_rocrate(self._temp_dir, name='name',
+                              organization_name='org',
+                              project_name='project',
+                              description='some description',
+                              keywords=['a'])
+        dataset_ids = []
+        for name in ['samples', 'unique']:
+            data_file = os.path.join(self._temp_dir, name + '.csv')
+            with open(data_file, 'w') as f:
+                f.write('a\n')
+            data_dict = {'name': name, 'author': 'author', 'version': '1',
+                         'date-published': '2024-01-01',
+                         'description': name + ' description',
+                         'data-format': 'csv', 'keywords': ['a']}
+            dataset_ids.append(prov.register_dataset(self._temp_dir,
+                                                     data_dict=data_dict,
+                                                     source_file=data_file,
+                                                     skip_copy=True))
+        with open(os.path.join(self._temp_dir, 'ro-crate-metadata.json'), 'r') as f:
+            crate = json.load(f)
+        crate_ids = {entry['@id'] for entry in crate['@graph']}
+        for dataset_id in dataset_ids:
+            self.assertTrue(dataset_id in crate_ids)
+
+    def test_register_does_not_change_working_directory(self):
+        prov = InProcessProvenanceUtil()
+        with patch('os.chdir', side_effect=AssertionError('chdir called')):
+            prov.register_rocrate(self._temp_dir, name='name',
+                                  organization_name='org',
+                                  project_name='project',
+                                  description='some description',
+                                  keywords=['a'])
+            data_file = os.path.join(self._temp_dir, 'data.csv')
+            with open(data_file, 'w') as f:
+                f.write('a\n')
+            data_dict = {'name': 'data', 'author': 'author', 'version': '1',
+                         'date-published': '2024-01-01',
+                         'description': 'data description',
+                         'data-format': 'csv', 'keywords': ['a']}
+            dataset_id = prov.register_dataset(self._temp_dir,
+                                               data_dict=data_dict,
+                                               source_file=data_file,
+                                               skip_copy=True)
+        self.assertTrue(dataset_id.startswith('ark:'))
+        self.assertFalse(os.path.isfile(os.path.join(os.getcwd(),
+                                                     'ro-crate-metadata.json')))
+
+    def test_get_args_under_cwd(self):
+        prov = InProcessProvenanceUtil()
+        cwd = os.path.abspath(self._temp_dir)
+        self.assertEqual(['rocrate', 'init', '--name', 'x'],
+                         prov._get_args_under_cwd(['rocrate', 'init',
+                                                   '--name', 'x'], None))
+        self.assertEqual(['rocrate', 'create', '--name', 'x', cwd],
+                         prov._get_args_under_cwd(['rocrate', 'init',
+                                                   '--name', 'x'], cwd))
+        self.assertEqual(['rocrate', 'register', 'software',
+                          '--filepath', 'https://foo.com/x',
+                          '--name', 'data.csv',
+                          '--schema', os.path.join(cwd, 'schema.json'),
+                          os.path.join(cwd, 'crate')],
+                         prov._get_args_under_cwd(['rocrate', 'register',
+                                                   'software',
+                                                   '--filepath',
+                                                   'https://foo.com/x',
+                                                   '--name', 'data.csv',
+                                                   '--schema', 'schema.json',
+                                                   'crate'], cwd))
+        self.assertEqual(['rocrate', 'add', 'dataset',
+                          '--source-filepath', '/a/b.csv',
+                          '--destination-filepath',
+                          os.path.join(cwd, 'b.csv'), cwd],
+                         prov._get_args_under_cwd(['rocrate', 'add', 'dataset',
+                                                   '--source-filepath',
+                                                   '/a/b.csv',
+                                                   '--destination-filepath',
+                                                   'b.csv', cwd], cwd))
+
+    def test_run_cmd_missing_option(self):
+        prov = InProcessProvenanceUtil()
+        exit_code, out, err = prov._run_cmd([prov._python, prov._binary,
+                                             'rocrate', 'register', 'dataset',
+                                             self._temp_dir],
+                                            cwd=self._temp_dir)
+        self.assertEqual(2, exit_code)
+        self.assertTrue('Missing option' in err)
+        self.assertTrue(os.path.isfile(os.path.join(self._temp_dir,
+                                                    'provenance_errors.json')))
+
+    def test_run_cmd_not_fairscape(self):
+        prov = InProcessProvenanceUtil()
+        exit_code, out, err = prov._run_cmd(['echo', 'hi'])
+        self.assertEqual(0, exit_code)
+        self.assertEqual('hi', out.strip())
+
+    def test_run_cmd_without_fairscape_cli(self):
+        prov = InProcessProvenanceUtil()
+        with patch.object(provenance, 'fairscape_cli', None):
+            with patch('cellmaps_utils.provenance.ProvenanceUtil._run_cmd',
+                       return_value=(0, 'out', 'err')) as mock_run:
+                self.assertEqual((0, 'out', 'err'),
+                                 prov._run_cmd([prov._python, prov._binary,
+                                                'rocrate', 'init']))
+                mock_run.assert_called_once()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `cellmaps_imagedownloader` package."""
+
+import os
+import unittest
+import tempfile
+import shutil
+import threading
+import functools
+from unittest.mock import patch
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from cellmaps_imagedownloader import runner
+from cellmaps_imagedownloader.exceptions import CellMapsImageDownloaderError
+from cellmaps_imagedownloader.runner import IoUringImageDownloader
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipUnless(IoUringImageDownloader.is_available(), 'io_uring not available')
+class TestIoUringImageDownloader(unittest.TestCase):
+    """Tests for `cellmaps_imagedownloader` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self._temp_dir = tempfile.mkdtemp()
+        self._srcdir = os.path.join(self._temp_dir, 'src')
+        self._destdir = os.path.join(self._temp_dir, 'dest')
+        os.makedirs(self._srcdir)
+        os.makedirs(self._destdir)
+        handler = functools.partial(QuietHandler, directory=self._srcdir)
+        self._server = HTTPServer(('127.0.0.1', 0), handler)
+        self._url = 'http://127.0.0.1:' + str(self._server.server_port)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._temp_dir)
+
+    def test_download_images(self):
+        d_list = []
+        # more images then SUBMIT_BATCH to write several batches
+        for x in range(IoUringImageDownloader.SUBMIT_BATCH * 2 + 5):
+            with open(os.path.join(self._srcdir, str(x) + '.jpg'), 'w') as f:
+                f.write('data' + str(x))
+            d_list.append((self._url + '/' + str(x) + '.jpg',
+                           os.path.join(self._destdir, str(x) + '.jpg')))
+        missing = (self._url + '/missing.jpg',
+                   os.path.join(self._destdir, 'missing.jpg'))
+        d_list.append(missing)
+        baddir = (self._url + '/0.jpg',
+                  os.path.join(self._destdir, 'nodir', '0.jpg'))
+        d_list.append(baddir)
+
+        dloader = IoUringImageDownloader(poolsize=2)
+        failed = dloader.download_images(download_list=d_list)
+        self.assertEqual(2, len(failed))
+        failed_dict = {x[2]: x[0] for x in failed}
+        self.assertEqual(404, failed_dict[missing])
+        self.assertEqual(-5, failed_dict[baddir])
+        self.assertFalse(os.path.isfile(missing[1]))
+        for x in range(IoUringImageDownloader.SUBMIT_BATCH * 2 + 5):
+            with open(os.path.join(self._destdir, str(x) + '.jpg'), 'r') as f:
+                self.assertEqual('data' + str(x), f.read())
+
+    def test_download_images_poolsize_one_uses_ring(self):
+        d_list = []
+        for x in range(3):
+            with open(os.path.join(self._srcdir, str(x) + '.jpg'), 'w') as f:
+                f.write('data' + str(x))
+            d_list.append((self._url + '/' + str(x) + '.jpg',
+                           os.path.join(self._destdir, str(x) + '.jpg')))
+        dloader = IoUringImageDownloader(poolsize=1)
+        with patch.object(runner.liburing, 'io_uring_submit_and_wait',
+                          wraps=runner.liburing.io_uring_submit_and_wait) as mock_submit:
+            failed = dloader.download_images(download_list=d_list)
+        self.assertEqual([], failed)
+        self.assertTrue(mock_submit.call_count > 0)
+        for x in range(3):
+            with open(os.path.join(self._destdir, str(x) + '.jpg'), 'r') as f:
+                self.assertEqual('data' + str(x), f.read())
+
+    def test_get_ring_one_per_thread(self):
+        dloader = IoUringImageDownloader(poolsize=2)
+        rings = {}
+
+        def get_ring(name):
+            rings[name] = (dloader._get_ring(), dloader._get_ring())
+
+        try:
+            for name in ['a', 'b']:
+                t = threading.Thread(target=get_ring, args=(name,))
+                t.start()
+                t.join()
+            self.assertIs(rings['a'][0], rings['a'][1])
+            self.assertIsNot(rings['a'][0], rings['b'][0])
+            self.assertEqual(2, len(dloader._rings))
+        finally:
+            for ring in dloader._rings:
+                runner.liburing.io_uring_queue_exit(ring)
+
+    def test_download_images_without_fixed_files(self):
+        with open(os.path.join(self._srcdir, 'a.jpg'), 'w') as f:
+            f.write('data')
+        dest_file = os.path.join(self._destdir, 'a.jpg')
+        dloader = IoUringImageDownloader(poolsize=1)
+        with patch.object(runner.liburing, 'io_uring_register_files_sparse',
+                          side_effect=OSError('not supported')):
+            failed = dloader.download_images(download_list=[(self._url + '/a.jpg',
+                                                             dest_file)])
+        self.assertEqual([], failed)
+        with open(dest_file, 'r') as f:
+            self.assertEqual('data', f.read())
+
+    def test_download_images_skip_existing(self):
+        dest_file = os.path.join(self._destdir, 'a.jpg')
+        with open(dest_file, 'w') as f:
+            f.write('blah')
+        dloader = IoUringImageDownloader(skip_existing=True)
+        failed = dloader.download_images(download_list=[(self._url + '/a.jpg',
+                                                         dest_file)])
+        self.assertEqual([], failed)
+        with open(dest_file, 'r') as f:
+            self.assertEqual('blah', f.read())
+
+
+class TestIoUringImageDownloaderNoLiburing(unittest.TestCase):
+
+    def test_constructor_without_liburing(self):
+        with patch.object(runner, 'liburing', None):
+            self.assertFalse(IoUringImageDownloader.is_available())
+            try:
+                IoUringImageDownloader()
+                self.fail('Expected Exception')
+            except CellMapsImageDownloaderError as ce:
+                self.assertEqual('liburing package and Linux 5.6+ are '
+                                 'required for IoUringImageDownloader',
+                                 str(ce))
@@ -32,3 +32,113 @@ class TestMultiprocessImageDownloader(unittest.TestCase):
             self.fail('Expected Exception')
         except CellMapsImageDownloaderError as ce:
             self.assertEqual('Subclasses should implement this', str(ce))
+
+    def test_download_images_poolsize_one(self):
+        def fake_dfunc(downloadtuple):
+            if downloadtuple[0].endswith('fail'):
+                return 500, 'error', downloadtuple
+            return None
+
+        dloader = runner.MultiProcessImageDownloader(poolsize=1,
+                                                     override_dfunc=fake_dfunc)
+        d_list = [('url' + str(x), '/dest' + str(x)) for x in range(100)]
+        d_list.append(('urlfail', '/destfail'))
+        failed = dloader.download_images(download_list=d_list)
+        self.assertEqual([(500, 'error', ('urlfail', '/destfail'))], failed)
+
+    def test_download_images_poolsize_two(self):
+        def fake_dfunc(downloadtuple):
+            if downloadtuple[0].endswith('fail'):
+                return 500, 'error', downloadtuple
+            return None
+
+        dloader = runner.MultiProcessImageDownloader(poolsize=2,
+                                                     override_dfunc=fake_dfunc)
+        d_list = [('url' + str(x), '/dest' + str(x)) for x in range(100)]
+        d_list.append(('urlfail', '/destfail'))
+        failed = dloader.download_images(download_list=d_list)
+        self.assertEqual([(500, 'error', ('urlfail', '/destfail'))], failed)
+
+    def test_get_chunksize(self):
+        dloader = runner.MultiProcessImageDownloader(poolsize=4)
+        self.assertEqual(1, dloader._get_chunksize(0))
+        self.assertEqual(1, dloader._get_chunksize(10))
+        self.assertEqual(64, dloader._get_chunksize(1024))
+        self.assertEqual(256, dloader._get_chunksize(400000))
+
+    def test_download_images_every_entry_downloaded_once(self):
+        downloaded = []
+
+        def fake_dfunc(downloadtuple):
+            downloaded.append(downloadtuple)
+            return None
+
+        dloader = runner.MultiProcessImageDownloader(poolsize=3,
+                                                     override_dfunc=fake_dfunc)
+        d_list = [('url' + str(x), '/dest' + str(x)) for x in range(1001)]
+        self.assertEqual([], dloader.download_images(download_list=d_list))
+        self.assertEqual(sorted(d_list), sorted(downloaded))
+
+    def test_download_images_generator_with_total(self):
+        downloaded = []
+
+        def fake_dfunc(downloadtuple):
+            downloaded.append(downloadtuple)
+            if downloadtuple[0] == 'url7':
+                return 500, 'error', downloadtuple
+            return None
+
+        for poolsize in [1, 2]:
+            del downloaded[:]
+            dloader = runner.MultiProcessImageDownloader(poolsize=poolsize,
+                                                         override_dfunc=fake_dfunc)
+            d_gen = (('url' + str(x), '/dest' + str(x)) for x in range(500))
+            failed = dloader.download_images(download_list=d_gen, total=500)
+            self.assertEqual([(500, 'error', ('url7', '/dest7'))], failed)
+            self.assertEqual(500, len(downloaded))
+
+    def test_get_chunksize_unknown_total(self):
+        dloader = runner.MultiProcessImageDownloader(poolsize=4)
+        self.assertEqual(64, dloader._get_chunksize(None))
+
+    def test_remove_existing_images(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            subdir = os.path.join(temp_dir, 'red')
+            os.makedirs(subdir)
+            with open(os.path.join(subdir, 'exists.jpg'), 'w') as f:
+                f.write('blah')
+            open(os.path.join(subdir, 'empty.jpg'), 'a').close()
+            with open(os.path.join(subdir, 'notinlist.jpg'), 'w') as f:
+                f.write('blah')
+            d_list = [('url1', os.path.join(subdir, 'exists.jpg')),
+                      ('url2', os.path.join(subdir, 'empty.jpg')),
+                      ('url3', os.path.join(subdir, 'missing.jpg')),
+                      ('url4', os.path.join(temp_dir, 'nodir', 'x.jpg'))]
+            res = list(runner._remove_existing_images(iter(d_list)))
+            self.assertEqual(d_list[1:], res)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_download_images_skip_existing(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dest_file = os.path.join(temp_dir, 'exists.jpg')
+            with open(dest_file, 'w') as f:
+                f.write('blah')
+            mockurl = 'http://fakey.fake.com/'
+            with requests_mock.mock() as m:
+                m.get(mockurl + 'new.jpg', status_code=200, text='somedata')
+                dloader = runner.MultiProcessImageDownloader(poolsize=1,
+                                                             skip_existing=True)
+                failed = dloader.download_images([(mockurl + 'exists.jpg', dest_file),
+                                                   (mockurl + 'new.jpg',
+                                                    os.path.join(temp_dir, 'new.jpg'))])
+                self.assertEqual(1, m.call_count)
+            self.assertEqual([], failed)
+            with open(dest_file, 'r') as f:
+                self.assertEqual('blah', f.read())
+            with open(os.path.join(temp_dir, 'new.jpg'), 'r') as f:
+                self.assertEqual('somedata', f.read())
+        finally:
+            shutil.rmtree(temp_dir)
@@ -31,6 +31,11 @@ class TestProteinAtlasImageUrlReader(unittest.TestCase):
         reader = ProteinAtlasImageUrlReader()
         self.assertEqual('39292/1495_A11_1_',
                          reader._get_image_id('http://images.proteinatlas.org/39292/1495_A11_1_blue_red_green.jpg'))
+        # url with fewer than two / does not raise an error
+        self.assertEqual('1495_A11_1_',
+                         reader._get_image_id('1495_A11_1_blue_red_green.jpg'))
+        self.assertEqual('39292/1495_A11_1_',
+                         reader._get_image_id('39292/1495_A11_1_blue_red_green.jpg'))
 
     def test_get_next_image_id_and_url(self):
         mockreader = MagicMock()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `ProteinAtlasProcessor` package."""
+import os
+import csv
+import unittest
+import tempfile
+import shutil
+
+from cellmaps_imagedownloader.proteinatlas import ProteinAtlasProcessor
+
+PROTEINATLAS_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<proteinAtlas>
+<entry url="https://www.proteinatlas.org/ENSG00000066455">
+  <name>GOLGA5</name>
+  <antibody id="HPA000992">
+    <cellExpression source="HPA">
+      <data>
+        <cellLine>U2OS</cellLine>
+        <location>Golgi apparatus</location>
+        <location>Cytosol</location>
+        <assayImage>
+          <image>
+            <imageUrl>http://images.proteinatlas.org/992/1_A1_1_blue_red_green.jpg</imageUrl>
+          </image>
+          <image>
+            <imageUrl>http://images.proteinatlas.org/992/1_A1_1_red_green.jpg</imageUrl>
+          </image>
+        </assayImage>
+      </data>
+      <data>
+        <cellLine>A-431</cellLine>
+        <location>Nucleus</location>
+        <assayImage>
+          <image>
+            <imageUrl>http://images.proteinatlas.org/992/2_B1_3_blue_red_green.jpg</imageUrl>
+          </image>
+        </assayImage>
+      </data>
+    </cellExpression>
+  </antibody>
+</entry>
+<entry url="https://www.proteinatlas.org/ENSG00000000001">
+  <name>NOANTIBODY</name>
+</entry>
+</proteinAtlas>
+"""
+
+
+class TestProteinAtlasProcessor(unittest.TestCase):
+    """Tests for `ProteinAtlasProcessor` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self._temp_dir = tempfile.mkdtemp()
+        self._proteinatlas = os.path.join(self._temp_dir, 'proteinatlas.xml')
+        with open(self._proteinatlas, 'w') as f:
+            f.write(PROTEINATLAS_XML)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self._temp_dir)
+
+    def _read_samples(self, samples_file):
+        with open(samples_file, 'r') as f:
+            return list(csv.DictReader(f))
+
+    def test_get_sample_list_from_hpa(self):
+        outdir = os.path.join(self._temp_dir, 'out')
+        processor = ProteinAtlasProcessor(outdir=outdir,
+                                          proteinatlas=self._proteinatlas)
+        samples_file, proteinatlas = processor.get_sample_list_from_hpa()
+        self.assertEqual(self._proteinatlas, proteinatlas)
+        samples = self._read_samples(samples_file)
+        self.assertEqual(2, len(samples))
+        self.assertEqual({'filename': '1_A1_1_',
+                          'if_plate_id': '1',
+                          'position': 'A1',
+                          'sample': '1',
+                          'status': '35',
+                          'locations': 'Golgi apparatus, Cytosol',
+                          'antibody': 'HPA000992',
+                          'ensembl_ids': 'ENSG00000066455',
+                          'gene_names': 'GOLGA5',
+                          'atlas_name': 'U2OS',
+                          'image_urls': 'http://images.proteinatlas.org/992/'
+                                        '1_A1_1_blue_red_green.jpg'},
+                         samples[0])
+        self.assertEqual('2_B1_3_', samples[1]['filename'])
+        self.assertEqual('Nucleus', samples[1]['locations'])
+
+    def test_get_sample_list_from_hpa_with_cell_line(self):
+        outdir = os.path.join(self._temp_dir, 'out')
+        processor = ProteinAtlasProcessor(outdir=outdir,
+                                          proteinatlas=self._proteinatlas,
+                                          cell_line='A-431')
+        samples_file, proteinatlas = processor.get_sample_list_from_hpa()
+        samples = self._read_samples(samples_file)
+        self.assertEqual(1, len(samples))
+        self.assertEqual('A-431', samples[0]['atlas_name'])
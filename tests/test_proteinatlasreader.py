@@ -12,6 +12,7 @@ from unittest.mock import patch, Mock
 import requests
 import requests_mock
 
+from cellmaps_imagedownloader import proteinatlas
 from cellmaps_imagedownloader.exceptions import CellMapsImageDownloaderError
 from cellmaps_imagedownloader.proteinatlas import ProteinAtlasReader
 
@@ -49,6 +50,21 @@ class TestProteinAtlasReader(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_readline_with_more_lines_than_progress_batch(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            proteinatlas_file = os.path.join(temp_dir, 'proteinatlas.xml')
+            with open(proteinatlas_file, 'w') as f:
+                for x in range(5):
+                    f.write('line' + str(x) + '\n')
+            reader = ProteinAtlasReader(outdir=temp_dir,
+                                        proteinatlas=proteinatlas_file)
+            with patch.object(proteinatlas, 'READ_PROGRESS_LINES', 2):
+                res = [a for a in reader.readline()]
+            self.assertEqual(['line' + str(x) + '\n' for x in range(5)], res)
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_readline_with_standard_gzip_file(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -69,6 +85,24 @@ class TestProteinAtlasReader(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_readline_with_gzip_file_using_igzip(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            proteinatlas_file = os.path.join(temp_dir, 'proteinatlas.xml.gz')
+            with gzip.open(proteinatlas_file, 'wt') as f:
+                f.write('line1\n')
+                f.write('line2\n')
+
+            reader = ProteinAtlasReader(outdir=temp_dir,
+                                        proteinatlas=proteinatlas_file)
+            mock_igzip = Mock(wraps=gzip)
+            with patch.object(proteinatlas, 'igzip', mock_igzip):
+                res = [a for a in reader.readline()]
+            self.assertEqual(['line1\n', 'line2\n'], res)
+            self.assertEqual('rt', mock_igzip.open.call_args[1]['mode'])
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_readline_with_gzip_url(self):
         temp_dir = tempfile.mkdtemp()
         try: